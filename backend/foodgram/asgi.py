@@ -0,0 +1,8 @@
+import os
+
+from foodgram.async_views import get_asgi_application
+
+os.environ['DJANGO_SETTINGS_MODULE'] = 'foodgram.settings'
+os.environ.setdefault('ASYNC_VIEWS', 'True')
+
+application = get_asgi_application()
@@ -0,0 +1,130 @@
+import functools
+
+import django
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.db import close_old_connections
+
+from .middleware import check_connections
+
+
+def run_view(view, request, *args, **kwargs):
+    '''
+    Выполняет вид целиком: запросы к базе и рендеринг ответа,
+    чтобы в цикл событий вернулись готовые байты и медленный
+    клиент не держал поток. Потоковый ответ читает по частям
+    StreamingASGIHandler.
+    Соединения потока обслуживаются так же, как сигналы
+    request_started и request_finished делают это под WSGI.
+    '''
+    close_old_connections()
+    if settings.DB_HEALTH_CHECKS:
+        check_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+    finally:
+        close_old_connections()
+    return response
+
+
+async def stream_parts(response):
+    '''
+    Части потокового ответа. Синхронный итератор (он может
+    читать базу) продвигается по одной части в потоке синхронного
+    кода, в том же, где request_finished закроет соединения.
+    '''
+    parts = iter(response)
+    next_part = sync_to_async(next, thread_sensitive=True)
+    while True:
+        part = await next_part(parts, None)
+        if part is None:
+            return
+        yield part
+
+
+class StreamingASGIHandler(ASGIHandler):
+    '''
+    ASGIHandler, который не читает потоковые ответы в цикле
+    событий: в Django 3.2 ASGIHandler перебирает их синхронно,
+    и запросы к базе внутри генератора там запрещены. Ответ
+    уходит клиенту по мере чтения и не копится в памяти.
+    '''
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+        headers = [
+            (header.encode('ascii'), value.encode('latin1'))
+            for header, value in response.items()
+        ]
+        headers.extend(
+            (b'Set-Cookie', cookie.output(header='').encode('ascii').strip())
+            for cookie in response.cookies.values()
+        )
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': headers,
+        })
+        async for part in stream_parts(response):
+            for chunk, _ in self.chunk_bytes(part):
+                await send({
+                    'type': 'http.response.body',
+                    'body': chunk,
+                    'more_body': True,
+                })
+        await send({'type': 'http.response.body'})
+        await sync_to_async(response.close, thread_sensitive=True)()
+
+
+def get_asgi_application():
+    '''Как django.core.asgi.get_asgi_application.'''
+    django.setup(set_prefix=False)
+    return StreamingASGIHandler()
+
+
+def async_view(view, async_actions):
+    '''
+    Async-обёртка вида DRF для ASGI. Запросы к действиям из
+    async_actions выполняются в пуле потоков и не ждут друг
+    друга; остальные идут в общий поток синхронного кода,
+    как обычные синхронные виды Django.
+    '''
+    pooled = sync_to_async(
+        functools.partial(run_view, view), thread_sensitive=False
+    )
+    serialized = sync_to_async(
+        functools.partial(run_view, view), thread_sensitive=True
+    )
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        action = view.actions.get(request.method.lower())
+        if action in async_actions:
+            return await pooled(request, *args, **kwargs)
+        return await serialized(request, *args, **kwargs)
+
+    return wrapper
+
+
+class AsyncReadMixin:
+    '''
+    С ASYNC_VIEWS (включается в foodgram.asgi) отдаёт действия
+    из async_actions через async-вид. Django 3.2 не умеет
+    асинхронный ORM, поэтому база и сериализаторы работают
+    в пуле потоков, а цикл событий тем временем держит
+    остальные соединения.
+    '''
+    async_actions = ('list', 'retrieve')
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+        if not settings.ASYNC_VIEWS:
+            return view
+        if not set(cls.async_actions) & set(view.actions.values()):
+            return view
+        return async_view(view, cls.async_actions)
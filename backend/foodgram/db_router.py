@@ -0,0 +1,67 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+
+class RoutingState:
+    '''Маршрутизация текущего запроса: можно ли читать с реплик
+    и была ли уже запись в основную базу.'''
+    __slots__ = ('replica_reads', 'wrote')
+
+    def __init__(self, replica_reads):
+        self.replica_reads = replica_reads
+        self.wrote = False
+
+
+# Вне запросов (команды, фоновые задачи) состояния нет,
+# и все запросы идут в основную базу.
+routing_state = ContextVar('routing_state', default=None)
+
+
+@contextmanager
+def route_request(replica_reads):
+    state = RoutingState(replica_reads)
+    token = routing_state.set(state)
+    try:
+        yield state
+    finally:
+        routing_state.reset(token)
+
+
+class ReplicaRouter:
+    '''
+    Отправляет чтение на реплики из DATABASE_REPLICAS, если
+    middleware разрешило это для текущего запроса и в нём ещё
+    не было записи. Запись, миграции и всё остальное идут
+    в default.
+    Токены (PRIMARY_ONLY_MODELS) всегда читаются из default:
+    вход - POST без Authorization, и только что выданный токен
+    ещё не закреплён за основной базой, а реплика могла его
+    не получить.
+    '''
+
+    def db_for_read(self, model, **hints):
+        state = routing_state.get()
+        if (
+            settings.DATABASE_REPLICAS
+            and model._meta.label_lower not in settings.PRIMARY_ONLY_MODELS
+            and state is not None
+            and state.replica_reads
+            and not state.wrote
+        ):
+            return random.choice(settings.DATABASE_REPLICAS)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        state = routing_state.get()
+        if state is not None:
+            state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -0,0 +1,141 @@
+import os
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+from prometheus_client.core import GaugeMetricFamily
+
+# С переменной PROMETHEUS_MULTIPROC_DIR prometheus_client хранит
+# значения в mmap-файлах этого каталога, по файлу на процесс,
+# и при выдаче складывает их по всем воркерам gunicorn.
+
+REQUEST_LATENCY = Histogram(
+    'foodgram_request_duration_seconds',
+    'Время ответа API по имени маршрута.',
+    ['route', 'method', 'status'],
+    buckets=(
+        0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+    ),
+)
+DB_QUERIES = Histogram(
+    'foodgram_db_queries',
+    'Число SQL-запросов на один запрос к API.',
+    ['route'],
+    buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55, 100),
+)
+DB_DURATION = Counter(
+    'foodgram_db_duration_seconds',
+    'Суммарное время SQL-запросов по маршруту.',
+    ['route'],
+)
+CACHE_REQUESTS = Counter(
+    'foodgram_cache_requests',
+    'Обращения к кешу приложения.',
+    ['cache', 'result'],
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    'foodgram_requests_in_progress',
+    'Запросы, которые обрабатываются прямо сейчас.',
+    multiprocess_mode='livesum',
+)
+DB_CONNECTIONS_OPEN = Gauge(
+    'foodgram_db_connections_open',
+    'Открытые соединения с базой данных по всем воркерам.',
+    ['alias'],
+    multiprocess_mode='livesum',
+)
+DB_CONNECTIONS_CREATED = Counter(
+    'foodgram_db_connections_created',
+    'Новые соединения с базой данных.',
+    ['alias'],
+)
+DB_CONNECTIONS_BROKEN = Counter(
+    'foodgram_db_connections_broken',
+    'Соединения, закрытые после неудачной проверки.',
+    ['alias'],
+)
+WORKERS = Gauge(
+    'foodgram_gunicorn_workers',
+    'Живые воркеры gunicorn.',
+    multiprocess_mode='livesum',
+)
+WORKER_REQUESTS = Counter(
+    'foodgram_gunicorn_worker_requests',
+    'Запросы, обработанные воркерами gunicorn.',
+)
+
+
+class ImageQueueCollector:
+    '''
+    Состояние очереди обработки картинок (recipes.jobs.queue_stats).
+    Считается запросом к базе в момент сбора метрик, поэтому
+    одинаково для всех воркеров и не складывается между ними.
+    '''
+
+    def describe(self):
+        # Без describe() регистрация вызвала бы collect() и запрос
+        # к базе ещё при импорте модуля.
+        return []
+
+    def collect(self):
+        from recipes.jobs import queue_stats
+        stats = queue_stats()
+        jobs = GaugeMetricFamily(
+            'foodgram_image_jobs',
+            'Задания обработки картинок по статусам.',
+            labels=['status'],
+        )
+        for status, total in stats['statuses'].items():
+            jobs.add_metric([status], total)
+        yield jobs
+        yield GaugeMetricFamily(
+            'foodgram_image_queue_oldest_pending_seconds',
+            'Возраст самого старого задания в очереди.',
+            value=stats['oldest_pending_age'],
+        )
+        latency = GaugeMetricFamily(
+            'foodgram_image_job_latency_seconds',
+            'Время от постановки задания в очередь до готовности '
+            'по последним IMAGE_JOB_STATS_WINDOW заданиям.',
+            labels=['stat'],
+        )
+        latency.add_metric(['avg'], stats['latency_avg'])
+        latency.add_metric(['max'], stats['latency_max'])
+        yield latency
+
+
+IMAGE_QUEUE = ImageQueueCollector()
+REGISTRY.register(IMAGE_QUEUE)
+
+
+def record_cache(name, hit):
+    '''Учитывает попадание или промах в кеш name.'''
+    CACHE_REQUESTS.labels(name, 'hit' if hit else 'miss').inc()
+
+
+def get_registry():
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(IMAGE_QUEUE)
+    return registry
+
+
+def metrics_view(request):
+    '''
+    Метрики в текстовом формате Prometheus. Нужен заголовок
+    Authorization: Bearer <METRICS_TOKEN>; без заданного токена
+    метрики открыты только с DEBUG.
+    '''
+    token = settings.METRICS_TOKEN
+    if not token:
+        if not settings.DEBUG:
+            return HttpResponseForbidden()
+    elif request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponseForbidden()
+    return HttpResponse(
+        generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST
+    )
@@ -0,0 +1,360 @@
+import asyncio
+import functools
+import hashlib
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from . import metrics
+from .db_router import route_request
+
+logger = logging.getLogger('foodgram.queries')
+
+
+class QueryCounter:
+    '''Обёртка для connection.execute_wrapper: считает запросы,
+    суммарное время в базе и повторы одного и того же SQL.'''
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.statements[sql] += 1
+
+    @property
+    def duplicates(self):
+        return self.count - len(self.statements)
+
+    def most_repeated(self):
+        if not self.statements:
+            return None, 0
+        return self.statements.most_common(1)[0]
+
+
+# Счётчики SQL текущего запроса. Контекст запроса переходит и в потоки,
+# где под ASGI работают синхронные виды и middleware, поэтому запросы
+# находят свои счётчики в любом потоке.
+active_counters = ContextVar('active_counters', default=())
+
+
+def count_active(execute, sql, params, many, context):
+    '''execute_wrapper всех соединений: отдаёт запрос счётчикам
+    текущего запроса, если они есть.'''
+    call = execute
+    for counter in active_counters.get():
+        call = functools.partial(counter, call)
+    return call(sql, params, many, context)
+
+
+def install_count_active(connection):
+    if count_active not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_active)
+
+
+def install_on_created(sender, connection, **kwargs):
+    install_count_active(connection)
+
+
+def install_on_request(**kwargs):
+    '''request_started приходит в поток, где Django выполняет
+    синхронный код запроса, и застаёт уже открытые соединения.'''
+    for connection in connections.all():
+        install_count_active(connection)
+
+
+def enable_query_counting():
+    connection_created.connect(
+        install_on_created, dispatch_uid='foodgram_count_active_created'
+    )
+    request_started.connect(
+        install_on_request, dispatch_uid='foodgram_count_active_request'
+    )
+    install_on_request()
+
+
+@contextmanager
+def count_queries():
+    '''Считает SQL-запросы блока во всех потоках, куда переходит
+    его контекст. Нужен enable_query_counting().'''
+    counter = QueryCounter()
+    token = active_counters.set((*active_counters.get(), counter))
+    try:
+        yield counter
+    finally:
+        active_counters.reset(token)
+
+
+def view_name(view_func, method):
+    '''Имя вида для логов: ViewSet.action для DRF и имя функции
+    для остальных.'''
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return getattr(view_func, '__name__', repr(view_func))
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(method.lower(), method.lower())
+    return f'{cls.__name__}.{action}'
+
+
+class AsyncCapableMiddleware:
+    '''
+    Основа для middleware, которые работают и под WSGI, и под ASGI.
+    Синхронный middleware под ASGI заставил бы Django проводить
+    все запросы через единственный поток синхронного кода.
+    '''
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Так же помечает себя django.utils.deprecation.MiddlewareMixin.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+
+class QueryInstrumentationMiddleware(AsyncCapableMiddleware):
+    '''Считает SQL-запросы каждого запроса, отдаёт их в заголовке
+    Server-Timing и пишет строку в лог foodgram.queries.
+
+    Выключенный через QUERY_INSTRUMENTATION middleware исключается
+    из цепочки целиком и ничего не стоит.'''
+
+    def __init__(self, get_response):
+        if not settings.QUERY_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        enable_query_counting()
+        self.threshold = settings.QUERY_COUNT_THRESHOLD
+        self.duplicate_threshold = settings.QUERY_DUPLICATE_THRESHOLD
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with count_queries() as counter:
+            response = self.get_response(request)
+        return self.finish(request, response, counter, started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        with count_queries() as counter:
+            response = await self.get_response(request)
+        return self.finish(request, response, counter, started)
+
+    def finish(self, request, response, counter, started):
+        total = time.perf_counter() - started
+        response['Server-Timing'] = (
+            f'db;dur={counter.duration * 1000:.2f};'
+            f'desc="{counter.count} queries", '
+            f'db-dup;desc="{counter.duplicates} duplicates", '
+            f'app;dur={total * 1000:.2f}'
+        )
+        self.log(request, response, counter, total)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.instrumented_view = view_name(view_func, request.method)
+
+    def log(self, request, response, counter, total):
+        sql, repeats = counter.most_repeated()
+        suspicious = (
+            counter.count > self.threshold
+            or repeats >= self.duplicate_threshold
+        )
+        record = {
+            'view': getattr(request, 'instrumented_view', None),
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': counter.count,
+            'duplicates': counter.duplicates,
+            'db_ms': round(counter.duration * 1000, 2),
+            'total_ms': round(total * 1000, 2),
+            'n_plus_one': suspicious,
+        }
+        message = ' '.join(f'{key}={value}' for key, value in record.items())
+        if suspicious:
+            logger.warning(
+                '%s repeated=%s sql=%s',
+                message, repeats, sql,
+                extra={'query_stats': record},
+            )
+        else:
+            logger.info(message, extra={'query_stats': record})
+
+
+class MetricsMiddleware(AsyncCapableMiddleware):
+    '''Пишет в метрики Prometheus время ответа, число и время
+    SQL-запросов по имени маршрута (recipes-list и т. п.).
+
+    Выключается настройкой METRICS_ENABLED.'''
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        enable_query_counting()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with metrics.REQUESTS_IN_PROGRESS.track_inprogress():
+            with count_queries() as counter:
+                response = self.get_response(request)
+        return self.observe(request, response, counter, started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        with metrics.REQUESTS_IN_PROGRESS.track_inprogress():
+            with count_queries() as counter:
+                response = await self.get_response(request)
+        return self.observe(request, response, counter, started)
+
+    def observe(self, request, response, counter, started):
+        total = time.perf_counter() - started
+        match = getattr(request, 'resolver_match', None)
+        route = match.url_name if match and match.url_name else 'unmatched'
+        metrics.REQUEST_LATENCY.labels(
+            route, request.method, response.status_code
+        ).observe(total)
+        metrics.DB_QUERIES.labels(route).observe(counter.count)
+        metrics.DB_DURATION.labels(route).inc(counter.duration)
+        metrics.WORKER_REQUESTS.inc()
+        return response
+
+
+class ReplicaRoutingMiddleware(AsyncCapableMiddleware):
+    '''
+    Разрешает безопасным запросам (GET, HEAD, OPTIONS) читать
+    с реплик. После записи (небезопасный метод или запись в базу,
+    например GET-переключатели избранного) клиент на
+    REPLICA_STICKY_SECONDS закрепляется за основной базой, чтобы
+    сразу видеть свои изменения: по cookie и, для клиентов
+    с токеном, по ключу в общем кеше.
+
+    Без DATABASE_REPLICAS middleware не подключается.
+    '''
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+    cookie_name = 'primary_db'
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        self.sticky_seconds = settings.REPLICA_STICKY_SECONDS
+
+    def pin_key(self, request):
+        authorization = request.META.get('HTTP_AUTHORIZATION')
+        if not authorization:
+            return None
+        digest = hashlib.sha256(authorization.encode()).hexdigest()
+        return f'primary_db:{digest}'
+
+    def is_pinned(self, request):
+        if request.method not in self.safe_methods:
+            return True
+        if request.COOKIES.get(self.cookie_name):
+            return True
+        key = self.pin_key(request)
+        return key is not None and cache.get(key) is not None
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with route_request(not self.is_pinned(request)) as state:
+            response = self.get_response(request)
+        return self.pin(request, response, state)
+
+    async def __acall__(self, request):
+        pinned = await sync_to_async(self.is_pinned)(request)
+        with route_request(not pinned) as state:
+            response = await self.get_response(request)
+        return await sync_to_async(self.pin)(request, response, state)
+
+    def pin(self, request, response, state):
+        if state.wrote or request.method not in self.safe_methods:
+            response.set_cookie(
+                self.cookie_name, '1',
+                max_age=self.sticky_seconds, httponly=True,
+            )
+            key = self.pin_key(request)
+            if key is not None:
+                cache.set(key, 1, timeout=self.sticky_seconds)
+        return response
+
+
+def count_created_connection(sender, connection, **kwargs):
+    metrics.DB_CONNECTIONS_CREATED.labels(connection.alias).inc()
+
+
+def check_connection(connection, interval):
+    if connection.connection is None:
+        return
+    now = time.monotonic()
+    checked = getattr(connection, 'health_checked', None)
+    if checked is not None and checked[0] is connection.connection:
+        if now - checked[1] < interval:
+            return
+    if connection.is_usable():
+        connection.health_checked = (connection.connection, now)
+        return
+    metrics.DB_CONNECTIONS_BROKEN.labels(connection.alias).inc()
+    connection.close()
+
+
+def check_connections():
+    '''Проверяет постоянные соединения текущего потока.'''
+    for connection in connections.all():
+        check_connection(connection, settings.DB_HEALTH_CHECK_INTERVAL)
+        metrics.DB_CONNECTIONS_OPEN.labels(connection.alias).set(
+            int(connection.connection is not None)
+        )
+
+
+class ConnectionHealthMiddleware(AsyncCapableMiddleware):
+    '''
+    Проверяет постоянные соединения (CONN_MAX_AGE) перед запросом
+    и закрывает оборванные, чтобы запрос открыл новое, а не упал
+    на первом SQL после перезапуска базы или PgBouncer.
+    Отдаёт в метрики число открытых и новых соединений.
+    Под ASGI проверяются соединения общего потока синхронных
+    видов; async-виды проверяют соединения своих потоков сами.
+    '''
+
+    def __init__(self, get_response):
+        if not settings.DB_HEALTH_CHECKS:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        connection_created.connect(
+            count_created_connection,
+            dispatch_uid='foodgram_count_created_connection',
+        )
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        check_connections()
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        await sync_to_async(check_connections)()
+        return await self.get_response(request)
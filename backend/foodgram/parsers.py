@@ -0,0 +1,32 @@
+import io
+
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONParser(JSONParser):
+    '''
+    JSONParser на orjson. Тела не в UTF-8 и тела, которые orjson
+    отвергает, разбирает стандартный парсер DRF: он же формирует
+    текст ошибки разбора, так что ответы с ошибками не меняются.
+    Единственное отличие: целые больше 64 бит orjson читает как
+    float, и поля сериализаторов отклоняют их как нецелые.
+    '''
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+        body = stream.read()
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            return super().parse(
+                io.BytesIO(body), media_type, parser_context
+            )
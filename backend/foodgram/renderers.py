@@ -0,0 +1,53 @@
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    '''
+    JSONRenderer на orjson с тем же выводом, что у рендерера DRF:
+    компактный UTF-8, даты, Decimal и прочие типы кодирует
+    rest_framework.utils.encoders.JSONEncoder.
+    С отступами (?indent, Accept: ...; indent=N), с настройками
+    UNICODE_JSON=False или COMPACT_JSON=False, на типах, которых
+    orjson не умеет (целые больше 64 бит), и без установленного
+    orjson работает стандартный рендерер DRF.
+    Единственное отличие: NaN и бесконечности записываются как null,
+    а рендерер DRF (STRICT_JSON) на них падает.
+    '''
+    if orjson is not None:
+        # Даты отдаются в default, чтобы формат совпадал с DRF:
+        # миллисекунды и Z вместо +00:00.
+        options = orjson.OPT_PASSTHROUGH_DATETIME
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=self.options,
+            )
+        except orjson.JSONEncodeError:
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        # Как и DRF, экранируем разделители строк, которые
+        # ломают встраивание JSON в JavaScript.
+        return ret.replace(
+            b'\xe2\x80\xa8', b'\\u2028'
+        ).replace(
+            b'\xe2\x80\xa9', b'\\u2029'
+        )
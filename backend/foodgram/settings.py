@@ -31,6 +31,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'foodgram.middleware.ConnectionHealthMiddleware',
+    'foodgram.middleware.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -38,8 +40,40 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'foodgram.middleware.QueryInstrumentationMiddleware',
+    'foodgram.middleware.MetricsMiddleware',
 ]
 
+QUERY_INSTRUMENTATION = (
+    os.environ.get('QUERY_INSTRUMENTATION', 'False') == 'True'
+)
+QUERY_COUNT_THRESHOLD = int(os.environ.get('QUERY_COUNT_THRESHOLD', 20))
+QUERY_DUPLICATE_THRESHOLD = int(
+    os.environ.get('QUERY_DUPLICATE_THRESHOLD', 5)
+)
+
+# Async-виды для чтения (foodgram.async_views); включаются
+# при запуске через foodgram.asgi.
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', 'False') == 'True'
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True') == 'True'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'foodgram.queries': {
+            'handlers': ['console'],
+            'level': os.environ.get('QUERY_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
 CORS_ORIGIN_ALLOW_ALL = True
 CORS_URLS_REGEX = r'^/api/.*$'
 
@@ -70,7 +104,16 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'foodgram.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'foodgram.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend'
@@ -98,8 +141,90 @@ DATABASES = {
         'PASSWORD': os.environ.get('POSTGRES_PASSWORD', default='postgres'),
         'HOST': os.environ.get('DB_HOST', default='db'),
         'PORT': os.environ.get('DB_PORT', default='5432'),
+        # Постоянные соединения воркеров gunicorn: соединение
+        # переиспользуется между запросами и закрывается не позже
+        # чем через DB_CONN_MAX_AGE секунд (0 - по соединению на запрос).
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        # За PgBouncer в режиме transaction курсоры на стороне
+        # сервера (QuerySet.iterator) не переживают транзакцию.
+        'DISABLE_SERVER_SIDE_CURSORS': (
+            os.environ.get('DB_PGBOUNCER', 'False') == 'True'
+        ),
     }
 }
+if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    DATABASES['default']['OPTIONS'] = {
+        'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 5)),
+        'keepalives': 1,
+        'keepalives_idle': 30,
+    }
+
+# Проверка постоянных соединений перед запросом (SELECT 1) не чаще
+# раза в DB_HEALTH_CHECK_INTERVAL секунд; 0 - перед каждым запросом.
+DB_HEALTH_CHECKS = os.environ.get('DB_HEALTH_CHECKS', 'True') == 'True'
+DB_HEALTH_CHECK_INTERVAL = int(os.environ.get('DB_HEALTH_CHECK_INTERVAL', 0))
+
+# Реплики только для чтения: DB_REPLICA_HOSTS=replica1,replica2.
+# Остальные параметры подключения берутся из default.
+DATABASE_REPLICAS = []
+for number, host in enumerate(
+    filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), 1
+):
+    alias = f'replica_{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['foodgram.db_router.ReplicaRouter']
+# Таблицы, которые всегда читаются из default.
+PRIMARY_ONLY_MODELS = ['authtoken.token']
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 10))
+TEST_RUNNER = 'foodgram.test_runner.ReplicaTestRunner'
+
+# В docker-compose кеш общий для всех воркеров и контейнеров:
+# Redis по REDIS_URL. Без него кеш живёт в памяти процесса,
+# и сбросы версий из сигналов видит только один воркер.
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': os.environ.get(
+                'CACHE_BACKEND',
+                default='django.core.cache.backends.locmem.LocMemCache'
+            ),
+            'LOCATION': os.environ.get('CACHE_LOCATION', default='foodgram'),
+        }
+    }
+CACHE_IS_SHARED = (
+    CACHES['default']['BACKEND']
+    != 'django.core.cache.backends.locmem.LocMemCache'
+)
+
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 10000))
+TOKEN_CACHE_TIMEOUT = int(os.environ.get('TOKEN_CACHE_TIMEOUT', 300))
+TOKEN_CACHE_LOCAL_TTL = int(os.environ.get('TOKEN_CACHE_LOCAL_TTL', 5))
+
+PAGINATION_COUNT_TIMEOUT = int(os.environ.get('PAGINATION_COUNT_TIMEOUT', 30))
+
+PAGINATION_COUNT_ESTIMATE_THRESHOLD = int(
+    os.environ.get('PAGINATION_COUNT_ESTIMATE_THRESHOLD', 100000)
+)
+
+# С локальным кешем другие воркеры не узнают о правке справочников,
+# поэтому и держат ответы недолго.
+REFERENCE_CACHE_TIMEOUT = int(os.environ.get(
+    'REFERENCE_CACHE_TIMEOUT', 60 * 60 * 24 if CACHE_IS_SHARED else 60
+))
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -136,8 +261,34 @@ STATIC_ROOT = os.path.join(BASE_DIR, "static")
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+RECIPE_IMAGE_FORMAT = os.environ.get('RECIPE_IMAGE_FORMAT', 'WEBP')
+RECIPE_IMAGE_QUALITY = int(os.environ.get('RECIPE_IMAGE_QUALITY', 80))
+RECIPE_IMAGE_MAX_SIZE = 2048
+RECIPE_IMAGE_VARIANTS = {
+    'image_card': 480,
+    'image_detail': 1200,
+}
+RECIPE_IMAGE_PLACEHOLDER_COLOR = '#e0e0e0'
+RECIPE_IMAGE_ASYNC = os.environ.get('RECIPE_IMAGE_ASYNC', 'True') == 'True'
+
+IMAGE_JOB_MAX_ATTEMPTS = 3
+IMAGE_JOB_TIMEOUT = 300
+IMAGE_JOB_STATS_WINDOW = 100
+
 AUTH_USER_MODEL = 'users.CustomUser'
 
+INGREDIENT_INDEX_TTL = int(os.environ.get('INGREDIENT_INDEX_TTL', 300))
+
+TRENDING_HALF_LIFE_HOURS = float(
+    os.environ.get('TRENDING_HALF_LIFE_HOURS', 72)
+)
+TRENDING_CART_WEIGHT = float(os.environ.get('TRENDING_CART_WEIGHT', 0.5))
+TRENDING_REBASE_HOURS = 24
+TRENDING_MIN_SCORE = 0.01
+
+FEED_SIZE = int(os.environ.get('FEED_SIZE', 500))
+FEED_FANOUT_LIMIT = int(os.environ.get('FEED_FANOUT_LIMIT', 1000))
+
 AUTHENTICATION_BACKENDS = ['django.contrib.auth.backends.ModelBackend']
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
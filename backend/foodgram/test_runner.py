@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.db import connections
+from django.test.runner import DiscoverRunner
+
+
+class ReplicaTestRunner(DiscoverRunner):
+    '''
+    В тестах реплики (DB_REPLICA_HOSTS) - зеркала default. TestCase
+    держит данные в незафиксированной транзакции, и отдельное
+    соединение зеркала их не видит, поэтому алиасы реплик получают
+    соединение default. Маршрутизация при этом не меняется:
+    чтение по-прежнему уходит на алиас реплики.
+    '''
+
+    def setup_databases(self, **kwargs):
+        old_config = super().setup_databases(**kwargs)
+        for alias in settings.DATABASE_REPLICAS:
+            connections[alias] = connections['default']
+        return old_config
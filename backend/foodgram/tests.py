@@ -0,0 +1,233 @@
+import datetime
+import decimal
+import io
+from unittest import mock, skipUnless
+
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .async_views import StreamingASGIHandler
+from .db_router import ReplicaRouter, route_request
+from .middleware import count_queries, enable_query_counting
+from .parsers import FastJSONParser
+from .renderers import FastJSONRenderer
+from recipes.cache import CachedReferenceMixin
+from recipes.models import Recipe
+from users.models import CustomUser
+
+
+class FastJSONTest(SimpleTestCase):
+    '''Рендерер и парсер на orjson ведут себя как классы DRF.'''
+
+    def test_renders_same_bytes(self):
+        now = timezone.now().replace(microsecond=123456)
+        cases = (
+            {
+                'created': now,
+                'date': now.date(),
+                'time': datetime.time(1, 2, 3, 4567),
+                'amount': decimal.Decimal('1.10'),
+                'name': 'Борщ ',
+                'values': [1.5, None, True],
+            },
+            {1: 'int key'},
+            [2 ** 70],
+            None,
+        )
+        for data in cases:
+            with self.subTest(data=data):
+                self.assertEqual(
+                    FastJSONRenderer().render(data),
+                    JSONRenderer().render(data),
+                )
+
+    def test_writes_nan_as_null(self):
+        '''Оговорённое отличие от DRF: NaN и бесконечности
+        не ошибка, а null. Кешированные ответы справочников
+        рендерятся так же.'''
+        data = {'values': [float('nan'), float('inf'), float('-inf')]}
+        with self.assertRaises(ValueError):
+            JSONRenderer().render(data)
+        for renderer in (
+            FastJSONRenderer(), CachedReferenceMixin.reference_renderer
+        ):
+            with self.subTest(renderer=renderer):
+                self.assertEqual(
+                    renderer.render(data), b'{"values":[null,null,null]}'
+                )
+
+    def test_parses_same_data(self):
+        body = '{"a": [1, 2.5, "й"], "b": null}'.encode()
+        self.assertEqual(
+            FastJSONParser().parse(io.BytesIO(body)),
+            JSONParser().parse(io.BytesIO(body)),
+        )
+
+
+class MetricsAccessTest(TestCase):
+    '''Доступ к /api/metrics.'''
+    databases = '__all__'
+
+    @override_settings(METRICS_TOKEN=None, DEBUG=False)
+    def test_closed_without_token(self):
+        self.assertEqual(self.client.get('/api/metrics').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token(self):
+        for header, status in (
+            ('Bearer secret', 200), ('Bearer wrong', 403), ('', 403),
+        ):
+            with self.subTest(header=header):
+                response = self.client.get(
+                    '/api/metrics', HTTP_AUTHORIZATION=header
+                )
+                self.assertEqual(response.status_code, status)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class ReplicaRouterTest(SimpleTestCase):
+    '''Выбор базы для чтения.'''
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    def test_outside_request(self):
+        self.assertEqual(self.router.db_for_read(Recipe), 'default')
+
+    def test_safe_request(self):
+        with route_request(True):
+            self.assertEqual(self.router.db_for_read(Recipe), 'replica_1')
+            self.assertEqual(self.router.db_for_read(Token), 'default')
+
+    def test_after_write(self):
+        with route_request(True):
+            self.router.db_for_write(Recipe)
+            self.assertEqual(self.router.db_for_read(Recipe), 'default')
+
+    def test_pinned_request(self):
+        with route_request(False):
+            self.assertEqual(self.router.db_for_read(Recipe), 'default')
+
+
+@skipUnless(settings.DATABASE_REPLICAS, 'нужен DB_REPLICA_HOSTS')
+class ReplicaRoutingTest(TestCase):
+    '''Запросы API с репликами (DB_REPLICA_HOSTS).'''
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username='reader', email='reader@foodgram.ru',
+            password='pass12345x',
+        )
+        self.reads = []
+        db_for_read = ReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            alias = db_for_read(router, model, **hints)
+            self.reads.append((model._meta.label_lower, alias))
+            return alias
+
+        patcher = mock.patch.object(ReplicaRouter, 'db_for_read', record)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_new_token_works_at_once(self):
+        response = self.client.post('/api/auth/token/login/', {
+            'email': self.user.email, 'password': 'pass12345x',
+        })
+        self.assertEqual(response.status_code, 200)
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION='Token ' + response.json()['auth_token']
+        )
+        self.reads.clear()
+        self.assertEqual(client.get('/api/users/me/').status_code, 200)
+        self.assertIn(('authtoken.token', 'default'), self.reads)
+
+    def test_safe_reads_go_to_replica(self):
+        self.assertEqual(self.client.get('/api/recipes/').status_code, 200)
+        self.assertIn(
+            ('recipes.recipe', settings.DATABASE_REPLICAS[0]), self.reads
+        )
+
+
+@override_settings(QUERY_INSTRUMENTATION=True)
+class QueryInstrumentationTest(TestCase):
+    '''Число SQL-запросов в заголовке Server-Timing.'''
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(
+            username='reader', email='reader@foodgram.ru',
+            password='pass12345x',
+        )
+        cls.url = f'/api/users/{cls.user.id}/'
+
+    async def asgi_get(self, path):
+        communicator = ApplicationCommunicator(StreamingASGIHandler(), {
+            'type': 'http',
+            'method': 'GET',
+            'path': path,
+            'query_string': b'',
+            'headers': [(b'host', b'testserver')],
+        })
+        await communicator.send_input({'type': 'http.request'})
+        start = await communicator.receive_output()
+        await communicator.receive_output()
+        return dict(start['headers'])
+
+    def test_server_timing(self):
+        response = self.client.get(self.url)
+        self.assertRegex(
+            response['Server-Timing'],
+            r'^db;dur=[\d.]+;desc="1 queries", '
+            r'db-dup;desc="0 duplicates", app;dur=[\d.]+$',
+        )
+
+    def test_log(self):
+        with self.assertLogs('foodgram.queries', 'INFO') as logs:
+            self.client.get(self.url)
+        [record] = logs.records
+        self.assertEqual(record.levelname, 'INFO')
+        self.assertEqual(record.query_stats['view'], 'UserViewSet.retrieve')
+        self.assertEqual(record.query_stats['queries'], 1)
+        self.assertFalse(record.query_stats['n_plus_one'])
+
+    @override_settings(QUERY_COUNT_THRESHOLD=0)
+    def test_log_slow_view(self):
+        with self.assertLogs('foodgram.queries', 'WARNING') as logs:
+            self.client.get(self.url)
+        [record] = logs.records
+        self.assertTrue(record.query_stats['n_plus_one'])
+        self.assertIn('sql=SELECT', record.getMessage())
+
+    def test_duplicates(self):
+        enable_query_counting()
+        with count_queries() as counter:
+            for _ in range(3):
+                list(CustomUser.objects.filter(pk=self.user.pk))
+            CustomUser.objects.count()
+        self.assertEqual(counter.count, 4)
+        self.assertEqual(counter.duplicates, 2)
+        self.assertEqual(counter.most_repeated()[1], 3)
+
+    async def test_asgi_sync_view(self):
+        '''Синхронный вид под ASGI работает в другом потоке,
+        и его запросы тоже попадают в счётчик.'''
+        headers = await self.asgi_get(self.url)
+        self.assertIn(b'desc="1 queries"', headers[b'Server-Timing'])
+
+    @override_settings(QUERY_DUPLICATE_THRESHOLD=1)
+    async def test_asgi_log(self):
+        with self.assertLogs('foodgram.queries', 'WARNING') as logs:
+            await self.asgi_get(self.url)
+        [record] = logs.records
+        self.assertEqual(record.query_stats['queries'], 1)
+        self.assertIn('repeated=1', record.getMessage())
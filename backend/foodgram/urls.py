@@ -4,6 +4,8 @@ from django.contrib import admin
 from django.urls import include, path
 from django.views.generic import TemplateView
 
+from foodgram.metrics import metrics_view
+
 urlpatterns = [
     path(
         'redoc/',
@@ -11,6 +13,7 @@ urlpatterns = [
         name='redoc'
     ),
     path('admin/', admin.site.urls),
+    path('api/metrics', metrics_view, name='metrics'),
     path('api/', include('recipes.urls')),
     path('api/', include('users.urls')),
     path('auth/', include('django.contrib.auth.urls')),
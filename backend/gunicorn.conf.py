@@ -0,0 +1,24 @@
+import os
+import shutil
+
+# Каталог для метрик prometheus_client общий для всех воркеров;
+# при старте мастера его очищают, чтобы не копить счётчики
+# прошлых запусков.
+PROMETHEUS_MULTIPROC_DIR = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', '/tmp/foodgram-metrics'
+)
+
+
+def on_starting(server):
+    shutil.rmtree(PROMETHEUS_MULTIPROC_DIR, ignore_errors=True)
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR)
+
+
+def post_fork(server, worker):
+    from foodgram.metrics import WORKERS
+    WORKERS.set(1)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,7 +1,9 @@
 from django.contrib import admin
 
-from .models import (Favorite, IngredAmount, Ingredient, Recipe, ShoppingCart,
-                     Tag)
+from .images import process_recipe_image
+from .jobs import queue_stats
+from .models import (Favorite, ImageJob, IngredAmount, Ingredient, Recipe,
+                     ShoppingCart, Tag)
 
 
 class IngredientAmountInLine(admin.TabularInline):
@@ -9,13 +11,22 @@ class IngredientAmountInLine(admin.TabularInline):
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ['name', 'author', 'favorited']
+    list_display = ['name', 'author', 'favorites_count', 'in_carts_count']
     list_filter = ['name', 'author', 'tags']
     search_fields = ['^name', ]
     inlines = [IngredientAmountInLine]
+    readonly_fields = [
+        'image_card', 'image_detail', 'favorites_count', 'in_carts_count',
+    ]
+    list_select_related = ['author']
 
-    def favorited(self, obj):
-        return Favorite.objects.filter(recipe=obj).count()
+    def save_model(self, request, obj, form, change):
+        if 'image' in form.changed_data:
+            image = form.cleaned_data['image']
+            image.seek(0)
+            for field, file in process_recipe_image(image.read()).items():
+                setattr(obj, field, file)
+        super().save_model(request, obj, form, change)
 
 
 class IngredientAdmin(admin.ModelAdmin):
@@ -29,9 +40,20 @@ class TagAdmin(admin.ModelAdmin):
     search_fields = ['^name', '^slug']
 
 
+class ImageJobAdmin(admin.ModelAdmin):
+    '''Задания обработки картинок; над списком - состояние очереди.'''
+    list_display = ['recipe', 'status', 'attempts', 'created', 'finished']
+    list_filter = ['status']
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = {**(extra_context or {}), 'queue_stats': queue_stats()}
+        return super().changelist_view(request, extra_context)
+
+
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Tag, TagAdmin)
 admin.site.register(Favorite)
 admin.site.register(ShoppingCart)
 admin.site.register(Ingredient, IngredientAdmin)
 admin.site.register(IngredAmount)
+admin.site.register(ImageJob, ImageJobAdmin)
@@ -0,0 +1,140 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .models import Favorite, FeedItem, ShoppingCart
+from foodgram.metrics import record_cache
+from foodgram.renderers import FastJSONRenderer
+from users.models import Follow
+
+# Строки этих моделей принадлежат пользователю (поле user), и выдача
+# одного пользователя не зависит от чужих строк. Их изменения меняют
+# версию данных только этого пользователя.
+USER_SCOPED_MODELS = (Favorite, FeedItem, Follow, ShoppingCart)
+
+
+def version_key(model, user_id=None):
+    key = f'version:{model._meta.label_lower}'
+    if user_id is not None:
+        key = f'{key}:user:{user_id}'
+    return key
+
+
+def add_version(key):
+    '''Заводит версию, если её ещё нет в кеше.'''
+    version = time.time()
+    if not cache.add(key, version, timeout=None):
+        version = cache.get(key, version)
+    return version
+
+
+def get_version(model):
+    '''
+    Версия данных модели: время последнего изменения
+    в секундах. Используется и как Last-Modified.
+    '''
+    version = cache.get(version_key(model))
+    if version is None:
+        version = add_version(version_key(model))
+    return version
+
+
+def get_versions(models, user_id=None):
+    '''
+    Версии нескольких моделей за одно обращение к кешу. Для моделей
+    из USER_SCOPED_MODELS к общей версии добавляется версия данных
+    пользователя user_id.
+    '''
+    keys = []
+    for model in models:
+        keys.append(version_key(model))
+        if user_id is not None and model in USER_SCOPED_MODELS:
+            keys.append(version_key(model, user_id))
+    found = cache.get_many(keys)
+    return [
+        found[key] if key in found else add_version(key) for key in keys
+    ]
+
+
+def version_user(model, instance):
+    '''Пользователь, чьи данные меняет instance, или None.'''
+    if model in USER_SCOPED_MODELS:
+        return instance.user_id
+    return None
+
+
+def response_key(model, version, request):
+    '''Ключ ответа: модель, версия данных, путь и параметры запроса.'''
+    params = urlencode(sorted(request.query_params.lists()), doseq=True)
+    digest = hashlib.md5(f'{request.path}?{params}'.encode()).hexdigest()
+    return f'reference:{model._meta.label_lower}:{version}:{digest}'
+
+
+def bump_version(model, user_id=None):
+    '''
+    Делает устаревшими закешированные данные по модели: все
+    или, если задан user_id, только данные этого пользователя.
+    '''
+    cache.set(version_key(model, user_id), time.time(), timeout=None)
+
+
+def bump_version_on_commit(model, user_id=None):
+    '''Меняет версию после фиксации текущей транзакции.'''
+    transaction.on_commit(lambda: bump_version(model, user_id))
+
+
+class CachedReferenceMixin:
+    '''
+    Кеширует готовые JSON-ответы на GET-запросы list и retrieve
+    для справочных данных (тэги, ингредиенты).
+    Ключ кеша включает версию данных модели и параметры запроса,
+    ответы отдаются с ETag и Last-Modified, на условные запросы
+    возвращается 304.
+    '''
+    reference_renderer = FastJSONRenderer()
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def cached_response(self, view_method, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return view_method(request, *args, **kwargs)
+        model = self.get_queryset().model
+        version = get_version(model)
+        key = response_key(model, version, request)
+        entry = cache.get(key)
+        record_cache('reference', entry is not None)
+        if entry is None:
+            response = view_method(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            content = self.reference_renderer.render(response.data)
+            entry = (content, hashlib.md5(content).hexdigest())
+            cache.set(
+                key, entry, timeout=settings.REFERENCE_CACHE_TIMEOUT
+            )
+        content, etag = entry
+        etag = quote_etag(etag)
+        last_modified = int(version)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = HttpResponse(
+                content, content_type=self.reference_renderer.media_type
+            )
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
@@ -0,0 +1,156 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models import F, Sum
+
+from .models import CartTotal, IngredAmount, ShoppingCart
+from .units import humanize, normalize
+
+# Остаток меньше этого считается нулём (погрешность float).
+EPSILON = 1e-6
+
+# Рецепты, списки покупок с которыми пересчитает defer_cart_rebuild.
+deferred_recipes = ContextVar('deferred_recipes', default=None)
+
+
+def normalized_totals(rows):
+    '''
+    Складывает строки (ключ, ингредиент, единица, количество)
+    по ключу, ингредиенту и базовой единице.
+    '''
+    totals = defaultdict(float)
+    for key, ingredient_id, unit, amount in rows:
+        amount, unit = normalize(amount, unit)
+        totals[key, ingredient_id, unit] += amount
+    return totals
+
+
+def update_cart_totals(user_id, recipe_id, sign):
+    '''
+    Прибавляет (sign=1) или вычитает (sign=-1) ингредиенты
+    рецепта из итогов списка покупок пользователя.
+    '''
+    deltas = normalized_totals(
+        (None, ingredient_id, unit, amount)
+        for ingredient_id, unit, amount in IngredAmount.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('ingredient_id', 'ingredient__measurement_unit',
+                      'amount')
+    )
+    with transaction.atomic():
+        existing = {
+            (total.ingredient_id, total.measurement_unit): total
+            for total in CartTotal.objects.select_for_update().filter(
+                user_id=user_id,
+                ingredient_id__in=[key[1] for key in deltas],
+            )
+        }
+        created, changed, emptied = [], [], []
+        for (_, ingredient_id, unit), amount in deltas.items():
+            total = existing.get((ingredient_id, unit))
+            if total is None:
+                if sign > 0:
+                    created.append(CartTotal(
+                        user_id=user_id, ingredient_id=ingredient_id,
+                        measurement_unit=unit, amount=amount,
+                    ))
+                continue
+            total.amount += sign * amount
+            if total.amount < EPSILON:
+                emptied.append(total.pk)
+            else:
+                changed.append(total)
+        CartTotal.objects.bulk_create(created)
+        CartTotal.objects.bulk_update(changed, ['amount'])
+        CartTotal.objects.filter(pk__in=emptied).delete()
+
+
+def rebuild_cart_totals(user_ids=None):
+    '''
+    Пересчитывает итоги списков покупок user_ids (или всех
+    пользователей) по текущему содержимому ShoppingCart.
+    Нужен после массовых правок мимо сигналов (bulk_create, update()).
+    '''
+    # Считаем от ShoppingCart: одно соединение с IngredAmount через
+    # рецепт, без второго JOIN корзин, который умножал бы суммы
+    # на число корзин с этим рецептом.
+    carts = ShoppingCart.objects.all()
+    totals = CartTotal.objects.all()
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        carts = carts.filter(user__in=user_ids)
+        totals = totals.filter(user__in=user_ids)
+    rows = carts.filter(
+        recipe__ingredients_amounts__isnull=False
+    ).values_list(
+        'user_id',
+        'recipe__ingredients_amounts__ingredient_id',
+        'recipe__ingredients_amounts__ingredient__measurement_unit',
+    ).annotate(
+        total=Sum('recipe__ingredients_amounts__amount')
+    ).order_by()
+    with transaction.atomic():
+        totals.delete()
+        CartTotal.objects.bulk_create(
+            [
+                CartTotal(
+                    user_id=user_id, ingredient_id=ingredient_id,
+                    measurement_unit=unit, amount=amount,
+                )
+                for (user_id, ingredient_id, unit), amount
+                in normalized_totals(rows.iterator()).items()
+            ],
+            batch_size=1000,
+        )
+
+
+def rebuild_recipe_carts(recipe_ids):
+    '''Пересчитывает итоги списков покупок с рецептами recipe_ids.'''
+    users = set(ShoppingCart.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('user_id', flat=True))
+    if users:
+        rebuild_cart_totals(users)
+
+
+def recipe_ingredients_changed(recipe_id):
+    '''
+    Ингредиенты рецепта изменились: итоги списков покупок
+    с ним пересчитываются сразу или, внутри defer_cart_rebuild,
+    один раз на выходе из блока.
+    '''
+    pending = deferred_recipes.get()
+    if pending is None:
+        rebuild_recipe_carts([recipe_id])
+    else:
+        pending.add(recipe_id)
+
+
+@contextmanager
+def defer_cart_rebuild():
+    '''
+    Копит изменённые рецепты и пересчитывает списки покупок
+    с ними одним проходом: для правки нескольких ингредиентов
+    рецепта и каскадного удаления. Возвращает множество, в которое
+    можно добавить рецепты, изменённые в обход сигналов.
+    '''
+    pending = set()
+    token = deferred_recipes.set(pending)
+    try:
+        yield pending
+    finally:
+        deferred_recipes.reset(token)
+    if pending:
+        rebuild_recipe_carts(pending)
+
+
+def shopping_list(user):
+    '''Строки списка покупок пользователя для выгрузки.'''
+    rows = CartTotal.objects.filter(user=user).values_list(
+        F('ingredient__name'), 'measurement_unit', 'amount'
+    ).order_by('ingredient__name', 'measurement_unit')
+    for name, unit, amount in rows.iterator():
+        amount, unit = humanize(amount, unit)
+        yield {'name': name, 'amount': amount, 'measurement_unit': unit}
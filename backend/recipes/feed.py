@@ -0,0 +1,134 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+
+from .cache import bump_version
+from .models import FeedItem, Recipe
+from users.models import CustomUser, Follow
+
+
+def trim_feeds(user_ids):
+    '''
+    Оставляет в лентах user_ids не больше FEED_SIZE последних
+    рецептов, одним DELETE с ROW_NUMBER() OVER (PARTITION BY user).
+    '''
+    if not user_ids:
+        return
+    ranked = FeedItem.objects.filter(user__in=user_ids).annotate(
+        row_number=Window(
+            expression=RowNumber(),
+            partition_by=[F('user')],
+            order_by=[F('pub_date').desc(), F('recipe').desc()],
+        )
+    ).order_by().values('id', 'row_number')
+    sql, params = ranked.query.sql_with_params()
+    FeedItem.objects.filter(id__in=RawSQL(
+        f'SELECT "id" FROM ({sql}) AS "ranked" WHERE "row_number" > %s',
+        (*params, settings.FEED_SIZE),
+    )).delete()
+
+
+def fan_out_recipe(recipe):
+    '''
+    Раскладывает новый рецепт по лентам подписчиков автора.
+    Если подписчиков больше FEED_FANOUT_LIMIT, рецепт остаётся
+    с fanned_out=False, автор получает флаг feed_pull, и его
+    рецепты попадают в ленты при чтении.
+    '''
+    limit = settings.FEED_FANOUT_LIMIT
+    followers = list(
+        Follow.objects.filter(author=recipe.author_id)
+        .values_list('user_id', flat=True)[:limit + 1]
+    )
+    if len(followers) > limit:
+        CustomUser.objects.filter(
+            pk=recipe.author_id, feed_pull=False
+        ).update(feed_pull=True)
+        return False
+    with transaction.atomic():
+        FeedItem.objects.bulk_create(
+            [
+                FeedItem(
+                    user_id=user_id, recipe=recipe, pub_date=recipe.pub_date
+                )
+                for user_id in followers
+            ],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+        trim_feeds(followers)
+        Recipe.objects.filter(pk=recipe.pk).update(fanned_out=True)
+    bump_version(FeedItem)
+    return True
+
+
+def backfill_feed(user, author):
+    '''Добавляет в ленту нового подписчика последние рецепты автора.'''
+    recipes = Recipe.objects.filter(
+        author=author, fanned_out=True
+    ).values_list('id', 'pub_date')[:settings.FEED_SIZE]
+    with transaction.atomic():
+        FeedItem.objects.bulk_create(
+            [
+                FeedItem(user=user, recipe_id=recipe_id, pub_date=pub_date)
+                for recipe_id, pub_date in recipes
+            ],
+            ignore_conflicts=True,
+        )
+        trim_feeds([user.pk])
+    bump_version(FeedItem, user.pk)
+
+
+def drop_from_feed(user, author):
+    '''Убирает из ленты рецепты автора после отписки.'''
+    FeedItem.objects.filter(user=user, recipe__author=author).delete()
+    bump_version(FeedItem, user.pk)
+
+
+FEED_ORDERING = ('-feed_pub_date', '-feed_recipe')
+
+
+def feed_recipes(queryset, user):
+    '''
+    Лента пользователя, сортировать по FEED_ORDERING. Обычно
+    она целиком лежит в FeedItem и читается по индексу
+    (user, pub_date, recipe): ключ сортировки берётся из FeedItem.
+    Рецепты авторов с feed_pull, не разосланные при записи,
+    добираются из подписок при чтении, тогда ключ - дата и id
+    самого рецепта.
+    '''
+    pull_authors = Follow.objects.filter(
+        user=user, author__feed_pull=True
+    ).values('author')
+    if not pull_authors.exists():
+        return queryset.filter(feed_items__user=user).annotate(
+            feed_pub_date=F('feed_items__pub_date'),
+            feed_recipe=F('feed_items__recipe'),
+        )
+    pulled = Recipe.objects.filter(
+        author__in=pull_authors, fanned_out=False
+    )
+    pushed = FeedItem.objects.filter(user=user).values('recipe')
+    return queryset.filter(
+        Q(id__in=pushed) | Q(id__in=pulled.values('id'))
+    ).annotate(feed_pub_date=F('pub_date'), feed_recipe=F('id'))
+
+
+def rebuild_feeds(batch_size=1000):
+    '''
+    Раскладывает по лентам все ещё не разосланные рецепты
+    авторов, у которых подписчиков не больше FEED_FANOUT_LIMIT.
+    Возвращает число разосланных рецептов.
+    '''
+    recipes = Recipe.objects.filter(fanned_out=False).order_by('pub_date')
+    fanned = 0
+    for recipe in recipes.only('id', 'author_id', 'pub_date').iterator(
+        chunk_size=batch_size
+    ):
+        fanned += fan_out_recipe(recipe)
+    CustomUser.objects.filter(feed_pull=True).exclude(
+        recipes__fanned_out=False
+    ).update(feed_pull=False)
+    return fanned
@@ -1,10 +1,22 @@
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection
+from django.db.models import Q
 from django_filters import rest_framework as filters
+from rest_framework.filters import OrderingFilter, SearchFilter
 
-from .models import CustomUser, Ingredient, Recipe
+from .models import CustomUser, IngredAmount, Ingredient, Recipe
+
+SEARCH_CONFIG = 'russian'
 
 
 class IngredientFilter(filters.FilterSet):
-    '''Фильтрует ингредиенты по названию.'''
+    '''
+    Фильтрует ингредиенты по названию. Регистр учитывается так же, как
+    в ingredient_index; в PostgreSQL LIKE по префиксу обслуживает индекс
+    "name" varchar_pattern_ops, который Django создаёт для unique-поля.
+    Индекс UPPER("name") из миграции 0005 нужен для ?search= ('^name').
+    '''
     name = filters.CharFilter(field_name='name', lookup_expr='startswith')
 
     class Meta:
@@ -26,13 +38,13 @@ class FilterRecipe(filters.FilterSet):
         user = self.request.user
         if user.is_anonymous:
             return queryset
-        return queryset.filter(favorites__user=user)
+        return queryset.filter(is_favorited=value)
 
     def get_is_in_shopping_cart(self, queryset, name, value):
         user = self.request.user
         if user.is_anonymous:
             return queryset
-        return queryset.filter(cart__user=user)
+        return queryset.filter(is_in_shopping_cart=value)
 
     class Meta:
         model = Recipe
@@ -42,3 +54,55 @@ class FilterRecipe(filters.FilterSet):
             'is_favorited',
             'is_in_shopping_cart',
         ]
+
+
+class StableOrderingFilter(OrderingFilter):
+    '''
+    Сортировка из параметра ordering с -id в конце, чтобы
+    рецепты с равным значением (например, favorites_count)
+    не перемешивались между страницами.
+    '''
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if not ordering or {'id', '-id'} & set(ordering):
+            return ordering
+        return [*ordering, '-id']
+
+
+class RecipeSearchFilter(SearchFilter):
+    '''
+    Полнотекстовый поиск по рецептам для PostgreSQL.
+    Ищет по названию и тексту рецепта (GIN-индекс) и по названиям
+    ингредиентов (триграммный индекс), сортирует по релевантности
+    и не дублирует рецепты.
+    На других СУБД работает как обычный SearchFilter.
+    '''
+
+    def filter_queryset(self, request, queryset, view):
+        if connection.vendor != 'postgresql':
+            return super().filter_queryset(request, queryset, view)
+        search_terms = self.get_search_terms(request)
+        if not search_terms:
+            return queryset
+        vector = SearchVector('name', 'text', config=SEARCH_CONFIG)
+        query = SearchQuery(' '.join(search_terms), config=SEARCH_CONFIG)
+        # Два отдельных запроса по индексам, объединённых UNION:
+        # условие "вектор совпал OR есть ингредиент" в одном WHERE
+        # планировщик выполняет полным перебором с to_tsvector
+        # на каждой строке.
+        by_text = Recipe.objects.annotate(
+            search_vector=vector
+        ).filter(search_vector=query).values('pk').order_by()
+        # Каждое слово запроса должно найтись в названии ингредиента.
+        by_ingredient = IngredAmount.objects.filter(
+            ingredient__in=Ingredient.objects.filter(*(
+                Q(name__icontains=term) for term in search_terms
+            ))
+        ).values('recipe').order_by()
+        queryset = queryset.filter(
+            id__in=by_text.union(by_ingredient)
+        ).annotate(search_rank=SearchRank(vector, query))
+        if request.query_params.get('ordering'):
+            return queryset
+        return queryset.order_by('-search_rank', *Recipe._meta.ordering)
@@ -0,0 +1,151 @@
+import base64
+import binascii
+import hashlib
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image, ImageOps
+from rest_framework import serializers
+
+ALLOWED_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp', 'PNG': 'png'}
+IMAGE_DIR = 'images/'
+
+
+def open_image(content, load=True):
+    '''
+    Декодирует картинку один раз и проверяет её формат.
+    С load=False читается только заголовок файла.
+    '''
+    try:
+        image = Image.open(BytesIO(content))
+        if load:
+            image.load()
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        raise serializers.ValidationError('Загрузите корректную картинку.')
+    if image.format not in ALLOWED_FORMATS:
+        raise serializers.ValidationError('Неподдерживаемый формат картинки.')
+    if not load:
+        return image
+    return ImageOps.exif_transpose(image)
+
+
+def encode_image(image, max_size):
+    '''
+    Уменьшает картинку до max_size по большей стороне и
+    кодирует в RECIPE_IMAGE_FORMAT. Имя файла - хеш содержимого.
+    '''
+    image_format = settings.RECIPE_IMAGE_FORMAT
+    variant = image.copy()
+    variant.thumbnail((max_size, max_size), Image.LANCZOS)
+    has_alpha = 'A' in variant.getbands() or 'transparency' in variant.info
+    if image_format == 'JPEG' or not has_alpha:
+        variant = variant.convert('RGB')
+    else:
+        variant = variant.convert('RGBA')
+    buffer = BytesIO()
+    variant.save(
+        buffer,
+        format=image_format,
+        quality=settings.RECIPE_IMAGE_QUALITY,
+        optimize=True,
+    )
+    content = buffer.getvalue()
+    name = hashlib.sha256(content).hexdigest()[:32]
+    return ContentFile(
+        content, name=f'{name}.{EXTENSIONS.get(image_format, "img")}'
+    )
+
+
+def store_image(file):
+    '''
+    Сохраняет файл под именем-хешем. Одинаковые картинки
+    (повторная загрузка, маленькая картинка во всех версиях)
+    хранятся одним файлом.
+    '''
+    name = f'{IMAGE_DIR}{file.name}'
+    if default_storage.exists(name):
+        return name
+    return default_storage.save(name, file)
+
+
+def placeholder_image():
+    '''Заглушка, которая показывается, пока картинка в очереди.'''
+    image = Image.new('RGB', (48, 48), settings.RECIPE_IMAGE_PLACEHOLDER_COLOR)
+    return store_image(encode_image(image, 48))
+
+
+def process_recipe_image(content):
+    '''
+    Готовит картинку рецепта: основной файл, ограниченный
+    RECIPE_IMAGE_MAX_SIZE, и уменьшенные версии из
+    RECIPE_IMAGE_VARIANTS. Возвращает значения полей модели.
+    '''
+    image = open_image(content)
+    sizes = {'image': settings.RECIPE_IMAGE_MAX_SIZE}
+    sizes.update(settings.RECIPE_IMAGE_VARIANTS)
+    return {
+        field: store_image(encode_image(image, max_size))
+        for field, max_size in sizes.items()
+    }
+
+
+class RecipeImageField(Base64ImageField):
+    '''
+    Картинка рецепта в base64.
+    При записи картинка декодируется один раз и превращается
+    в основной файл и уменьшенные версии (поля image, image_card,
+    image_detail модели Recipe). При RECIPE_IMAGE_ASYNC обработка
+    откладывается: рецепт получает заглушку, а исходный файл
+    передаётся в очередь (image_source).
+    При чтении отдаётся версия, подходящая по контексту:
+    variant, а если он не задан - карточка для списка
+    и крупная версия для страницы рецепта.
+    '''
+
+    def __init__(self, *args, variant=None, **kwargs):
+        kwargs['source'] = '*'
+        self.variant = variant
+        super().__init__(*args, **kwargs)
+
+    def to_internal_value(self, base64_data):
+        if not isinstance(base64_data, str) or not base64_data:
+            raise serializers.ValidationError(self.INVALID_FILE_MESSAGE)
+        if ';base64,' in base64_data:
+            base64_data = base64_data.split(';base64,')[1]
+        try:
+            content = base64.b64decode(base64_data)
+        except (TypeError, binascii.Error, ValueError):
+            raise serializers.ValidationError(self.INVALID_FILE_MESSAGE)
+        if not settings.RECIPE_IMAGE_ASYNC:
+            return process_recipe_image(content)
+        source = open_image(content, load=False)
+        placeholder = placeholder_image()
+        return {
+            'image': placeholder,
+            'image_card': placeholder,
+            'image_detail': placeholder,
+            'image_source': ContentFile(
+                content,
+                name=f'{hashlib.sha256(content).hexdigest()[:32]}.'
+                     f'{source.format.lower()}',
+            ),
+        }
+
+    def get_variant(self):
+        if self.variant is not None:
+            return self.variant
+        view = self.context.get('view')
+        card_actions = getattr(view, 'card_image_actions', ('list',))
+        if getattr(view, 'action', None) in card_actions:
+            return 'image_card'
+        return 'image_detail'
+
+    def to_representation(self, recipe):
+        image = getattr(recipe, self.get_variant()) or recipe.image
+        if not image:
+            return None
+        return super().to_representation(image)
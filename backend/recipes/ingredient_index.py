@@ -0,0 +1,78 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+
+from .models import Ingredient
+
+
+class IngredientPrefixIndex:
+    '''
+    Индекс названий ингредиентов в памяти процесса
+    для автодополнения по префиксу.
+    Хранит отсортированный список названий и параллельные
+    массивы id и единиц измерения, загружается при первом
+    обращении и сбрасывается сигналами модели Ingredient.
+    '''
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._data = None
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._data = None
+
+    def _load(self):
+        rows = sorted(
+            Ingredient.objects.values_list(
+                'name', 'id', 'measurement_unit'
+            ).iterator()
+        )
+        names = []
+        ids = array('q')
+        units = []
+        unit_values = {}
+        for name, pk, unit in rows:
+            names.append(name)
+            ids.append(pk)
+            units.append(unit_values.setdefault(unit, unit))
+        return names, ids, units
+
+    def _get(self):
+        data = self._data
+        ttl = self.ttl
+        if ttl is None:
+            ttl = getattr(settings, 'INGREDIENT_INDEX_TTL', None)
+        expired = ttl is not None and time.monotonic() - self._loaded_at > ttl
+        if data is not None and not expired:
+            return data
+        with self._lock:
+            if self._data is data:
+                self._data = self._load()
+                self._loaded_at = time.monotonic()
+            return self._data
+
+    def startswith(self, prefix):
+        '''
+        Ингредиенты, название которых начинается с prefix,
+        в порядке Ingredient.Meta.ordering (сначала новые).
+        '''
+        names, ids, units = self._get()
+        start = bisect_left(names, prefix)
+        end = bisect_left(names, prefix + '\U0010ffff', start)
+        found = sorted(range(start, end), key=ids.__getitem__, reverse=True)
+        return [
+            {
+                'id': ids[position],
+                'name': names[position],
+                'measurement_unit': units[position],
+            }
+            for position in found
+        ]
+
+
+ingredient_index = IngredientPrefixIndex()
@@ -0,0 +1,147 @@
+import logging
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+from .images import process_recipe_image, store_image
+from .models import ImageJob, Recipe
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_image_job(recipe, source):
+    '''
+    Ставит исходную картинку рецепта в очередь.
+    Невыполненные задания по этому рецепту больше не нужны.
+    '''
+    for job in ImageJob.objects.filter(
+        recipe=recipe, status=ImageJob.PENDING
+    ):
+        job.source.delete(save=False)
+        job.delete()
+    return ImageJob.objects.create(recipe=recipe, source=source)
+
+
+def claim_job():
+    '''
+    Забирает из очереди самое старое задание.
+    Задания, зависшие в обработке дольше IMAGE_JOB_TIMEOUT,
+    возвращаются в работу. Параллельные обработчики на PostgreSQL
+    не мешают друг другу (SKIP LOCKED).
+    '''
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.IMAGE_JOB_TIMEOUT)
+    with transaction.atomic():
+        job = ImageJob.objects.select_for_update(skip_locked=True).filter(
+            Q(status=ImageJob.PENDING)
+            | Q(status=ImageJob.PROCESSING, started__lt=stale)
+        ).order_by('id').first()
+        if job is None:
+            return None
+        job.status = ImageJob.PROCESSING
+        job.started = now
+        job.attempts = F('attempts') + 1
+        job.save(update_fields=['status', 'started', 'attempts'])
+    job.refresh_from_db(fields=['attempts'])
+    return job
+
+
+def save_images(job, files):
+    '''
+    Записывает файлы в рецепт, если после job картинку рецепта
+    не загрузили заново. Задание по старой картинке, которое
+    обрабатывалось во время новой загрузки, ничего не меняет.
+    '''
+    return bool(
+        Recipe.objects.filter(pk=job.recipe_id).exclude(
+            image_jobs__pk__gt=job.pk
+        ).update(**files)
+    )
+
+
+def fall_back_to_source(job):
+    '''
+    Если картинку так и не удалось обработать, рецепт показывает
+    исходный файл вместо заглушки.
+    '''
+    try:
+        with job.source.open('rb') as source:
+            original = store_image(ContentFile(
+                source.read(), name=os.path.basename(job.source.name)
+            ))
+    except OSError:
+        logger.exception('Image job %s has no source', job.pk)
+        return
+    fields = ['image', *settings.RECIPE_IMAGE_VARIANTS]
+    save_images(job, dict.fromkeys(fields, original))
+
+
+def run_job(job):
+    '''Обрабатывает картинку и записывает результат в рецепт.'''
+    try:
+        with job.source.open('rb') as source:
+            files = process_recipe_image(source.read())
+    except Exception as error:
+        failed = job.attempts >= settings.IMAGE_JOB_MAX_ATTEMPTS
+        job.status = ImageJob.FAILED if failed else ImageJob.PENDING
+        job.error = str(error)
+        job.finished = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished'])
+        logger.exception('Image job %s failed', job.pk)
+        if failed:
+            fall_back_to_source(job)
+        return False
+    job.status = ImageJob.DONE
+    job.error = ''
+    if not save_images(job, files):
+        job.error = 'Картинку рецепта заменили, результат не сохранён.'
+    job.finished = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished'])
+    job.source.delete(save=False)
+    logger.info(
+        'Image job %s done in %.3fs',
+        job.pk, (job.finished - job.created).total_seconds(),
+    )
+    return True
+
+
+def queue_stats():
+    '''
+    Состояние очереди: число заданий по статусам, возраст
+    самого старого задания в очереди и время от постановки
+    в очередь до готовности по последним IMAGE_JOB_STATS_WINDOW
+    заданиям (в секундах).
+    '''
+    stats = {status: 0 for status, _ in ImageJob.CHOICES_STATUS}
+    stats.update(
+        ImageJob.objects.order_by().values_list('status').annotate(
+            total=Count('id')
+        )
+    )
+    oldest = ImageJob.objects.filter(
+        status=ImageJob.PENDING
+    ).aggregate(oldest=Min('created'))['oldest']
+    latencies = [
+        (finished - created).total_seconds()
+        for created, finished in ImageJob.objects.filter(
+            status=ImageJob.DONE
+        ).order_by('-finished').values_list(
+            'created', 'finished'
+        )[:settings.IMAGE_JOB_STATS_WINDOW]
+    ]
+    return {
+        'depth': stats[ImageJob.PENDING],
+        'statuses': stats,
+        'oldest_pending_age': (
+            (timezone.now() - oldest).total_seconds() if oldest else 0
+        ),
+        'latency_avg': (
+            sum(latencies) / len(latencies) if latencies else 0
+        ),
+        'latency_max': max(latencies, default=0),
+    }
@@ -0,0 +1,156 @@
+import json
+import math
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import CustomUser
+
+
+DEEP_PAGE = 100
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогоняет основные запросы API внутри процесса и печатает '
+        'p50/p99 времени ответа и число SQL-запросов. С порогами '
+        '--max-p99-ms и --max-queries завершается ошибкой при регрессии.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument(
+            '--email',
+            help='Пользователь, от имени которого идут запросы.',
+        )
+        parser.add_argument('--host', default='localhost')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--max-p99-ms', type=float, default=None)
+        parser.add_argument('--max-queries', type=int, default=None)
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Вывести результат в JSON.',
+        )
+
+    def get_user(self, email):
+        users = CustomUser.objects.all()
+        if email:
+            users = users.filter(email=email)
+        user = users.first()
+        if user is None:
+            raise CommandError(
+                'Нет пользователей, сначала выполните generate_data.'
+            )
+        return user
+
+    def get_deep_page(self):
+        '''Страница DEEP_PAGE или последняя, если рецептов меньше.'''
+        pages = math.ceil(
+            Recipe.objects.count()
+            / settings.REST_FRAMEWORK['PAGE_SIZE']
+        )
+        return max(1, min(DEEP_PAGE, pages))
+
+    def get_scenarios(self):
+        tags = list(Tag.objects.values_list('slug', flat=True)[:3])
+        deep_page = self.get_deep_page()
+        names = list(
+            Ingredient.objects.values_list('name', flat=True)[:200]
+        ) or ['а']
+        return {
+            'recipes-list': lambda: '/api/recipes/',
+            'recipes-list-tags': lambda: '/api/recipes/?' + '&'.join(
+                f'tags={tag}' for tag in tags
+            ),
+            'recipes-list-favorited': lambda: (
+                '/api/recipes/?is_favorited=1'
+            ),
+            'recipes-list-deep-page': lambda: (
+                f'/api/recipes/?page={deep_page}'
+            ),
+            'recipes-list-cursor': lambda: '/api/recipes/?cursor=',
+            'ingredients-autocomplete': lambda: (
+                '/api/ingredients/?name='
+                + self.random.choice(names)[:self.random.randint(1, 3)]
+            ),
+            'users-subscriptions': lambda: (
+                '/api/users/subscriptions/?recipes_limit=3'
+            ),
+            'recipes-download-shopping-cart': lambda: (
+                '/api/recipes/download_shopping_cart/'
+            ),
+        }
+
+    def measure(self, client, make_url, total):
+        timings = []
+        queries = []
+        for _ in range(total):
+            url = make_url()
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = client.get(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                raise CommandError(f'{url}: {response.status_code}')
+            queries.append(len(context.captured_queries))
+        return {
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p99_ms': round(percentile(timings, 0.99), 2),
+            'mean_ms': round(statistics.mean(timings), 2),
+            'queries': max(queries),
+        }
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        user = self.get_user(options['email'])
+        token, _ = Token.objects.get_or_create(user=user)
+        client = Client(
+            HTTP_HOST=options['host'],
+            HTTP_AUTHORIZATION=f'Token {token.key}',
+        )
+        results = {
+            name: self.measure(client, make_url, options['requests'])
+            for name, make_url in self.get_scenarios().items()
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self.stdout.write(
+                f'{"сценарий":<34}{"p50, мс":>10}{"p99, мс":>10}'
+                f'{"среднее":>10}{"запросов":>10}'
+            )
+            for name, result in results.items():
+                self.stdout.write(
+                    f'{name:<34}{result["p50_ms"]:>10}{result["p99_ms"]:>10}'
+                    f'{result["mean_ms"]:>10}{result["queries"]:>10}'
+                )
+        failures = [
+            name for name, result in results.items()
+            if (
+                options['max_p99_ms'] is not None
+                and result['p99_ms'] > options['max_p99_ms']
+            ) or (
+                options['max_queries'] is not None
+                and result['queries'] > options['max_queries']
+            )
+        ]
+        if failures:
+            raise CommandError(
+                'Превышены пороги: ' + ', '.join(failures)
+            )
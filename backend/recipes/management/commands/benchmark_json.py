@@ -0,0 +1,91 @@
+import io
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from foodgram.parsers import FastJSONParser
+from foodgram.renderers import FastJSONRenderer, orjson
+from recipes.serializers import RecipeSerializer
+from recipes.views import RecipesViewSet
+
+
+def best_of(func, number, repeat):
+    '''Лучшее из repeat замеров среднего времени вызова, в мс.'''
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - started) / number)
+    return min(timings) * 1000
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает рендеринг и разбор JSON стандартными классами DRF '
+        'и классами на orjson на странице рецептов RecipeSerializer.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=6,
+            help='Рецептов на странице.',
+        )
+        parser.add_argument('--host', default='localhost')
+        parser.add_argument('--number', type=int, default=200)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def get_page(self, size, host):
+        request = Request(
+            RequestFactory().get('/api/recipes/', HTTP_HOST=host)
+        )
+        view = RecipesViewSet(
+            request=request, format_kwarg=None, action='list'
+        )
+        queryset = view.get_queryset().order_by(*view.cursor_ordering)
+        page = RecipeSerializer(
+            queryset[:size],
+            many=True,
+            context={'request': request, 'view': view},
+        ).data
+        if not page:
+            raise CommandError(
+                'Нет рецептов, сначала выполните generate_data.'
+            )
+        return {'count': len(page), 'results': page}
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            raise CommandError('orjson не установлен.')
+        data = self.get_page(options['page_size'], options['host'])
+        rendered = JSONRenderer().render(data)
+        fast_rendered = FastJSONRenderer().render(data)
+        if json.loads(rendered) != json.loads(fast_rendered):
+            raise CommandError('Рендереры дали разный JSON.')
+        cases = (
+            ('render', JSONRenderer(), FastJSONRenderer(),
+             lambda renderer: renderer.render(data)),
+            ('parse', JSONParser(), FastJSONParser(),
+             lambda parser: parser.parse(io.BytesIO(rendered))),
+        )
+        self.stdout.write(
+            f'{len(data["results"])} рецептов, {len(rendered)} байт'
+        )
+        for name, standard, fast, call in cases:
+            slow_ms = best_of(
+                lambda: call(standard), options['number'], options['repeat']
+            )
+            fast_ms = best_of(
+                lambda: call(fast), options['number'], options['repeat']
+            )
+            self.stdout.write(
+                f'{name:<8} drf={slow_ms:.3f} мс  orjson={fast_ms:.3f} мс  '
+                f'x{slow_ms / fast_ms:.1f}'
+            )
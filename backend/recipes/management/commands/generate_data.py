@@ -0,0 +1,188 @@
+import random
+import time
+from array import array
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.cache import bump_version
+from recipes.cart import rebuild_cart_totals
+from recipes.images import placeholder_image
+from recipes.models import (Favorite, IngredAmount, Ingredient, Recipe,
+                            ShoppingCart, Tag)
+from recipes.queries import reconcile_recipe_counters
+from users.models import CustomUser, Follow
+
+DEFAULT_TAGS = [
+    ('Завтрак', 'breakfast', Tag.ORANGE),
+    ('Обед', 'lunch', Tag.GREEN),
+    ('Ужин', 'dinner', Tag.PURPLE),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Наполняет базу синтетическими данными для нагрузочного '
+        'тестирования: пользователи, рецепты, ингредиенты рецептов, '
+        'избранное, списки покупок и подписки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=10
+        )
+        parser.add_argument('--favorites', type=int, default=20000)
+        parser.add_argument('--carts', type=int, default=5000)
+        parser.add_argument('--follows', type=int, default=5000)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        ingredient_ids = array(
+            'q', Ingredient.objects.values_list('id', flat=True)
+        )
+        if len(ingredient_ids) < options['ingredients_per_recipe']:
+            raise CommandError(
+                'Недостаточно ингредиентов, сначала выполните '
+                'load_ingredients.'
+            )
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, slug=slug, color=color)
+                for name, slug, color in DEFAULT_TAGS
+            )
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+
+        user_ids = self.create_users(options['users'])
+        recipe_ids = self.create_recipes(options['recipes'], user_ids)
+        self.create_links(
+            'Теги рецептов',
+            Recipe.tags.through,
+            options['recipes'],
+            lambda: Recipe.tags.through(
+                recipe_id=self.random.choice(recipe_ids),
+                tag_id=self.random.choice(tag_ids),
+            ),
+        )
+        self.create_ingredient_amounts(
+            recipe_ids, ingredient_ids, options['ingredients_per_recipe']
+        )
+        for title, model, total in (
+            ('Избранное', Favorite, options['favorites']),
+            ('Списки покупок', ShoppingCart, options['carts']),
+        ):
+            self.create_links(title, model, total, lambda model=model: model(
+                user_id=self.random.choice(user_ids),
+                recipe_id=self.random.choice(recipe_ids),
+            ))
+        self.create_links('Подписки', Follow, options['follows'], lambda: (
+            Follow(**dict(zip(
+                ('user_id', 'author_id'), self.random.sample(user_ids, 2)
+            )))
+        ))
+        reconcile_recipe_counters(options['batch_size'])
+        rebuild_cart_totals()
+        for model in (CustomUser, Recipe, Favorite, ShoppingCart, Follow):
+            bump_version(model)
+
+    def write(self, title, model, objects, total, started):
+        with transaction.atomic():
+            model.objects.bulk_create(objects, ignore_conflicts=True)
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'{title}: {total} ({total / max(elapsed, 1e-6):.0f} строк/с)'
+        )
+
+    def new_ids(self, model, last_id):
+        return array('q', model.objects.filter(
+            id__gt=last_id
+        ).order_by('id').values_list('id', flat=True).iterator())
+
+    def last_id(self, model):
+        last = model.objects.order_by('-id').values_list('id', flat=True)
+        return last.first() or 0
+
+    def create_users(self, total):
+        last_id = self.last_id(CustomUser)
+        password = make_password('loadtest-password')
+        started = time.monotonic()
+        for offset in range(0, total, self.batch_size):
+            users = [
+                CustomUser(
+                    email=f'loadtest{last_id + number}@example.com',
+                    username=f'loadtest{last_id + number}',
+                    first_name='Нагрузка',
+                    last_name=f'Тест {number}',
+                    password=password,
+                )
+                for number in range(
+                    offset, min(offset + self.batch_size, total)
+                )
+            ]
+            self.write(
+                'Пользователи', CustomUser, users,
+                offset + len(users), started,
+            )
+        return self.new_ids(CustomUser, last_id)
+
+    def create_recipes(self, total, user_ids):
+        last_id = self.last_id(Recipe)
+        image = placeholder_image()
+        started = time.monotonic()
+        for offset in range(0, total, self.batch_size):
+            recipes = [
+                Recipe(
+                    author_id=self.random.choice(user_ids),
+                    name=f'Рецепт {last_id + number}',
+                    text='Синтетический рецепт для нагрузочного теста.',
+                    cooking_time=self.random.randint(5, 180),
+                    image=image,
+                    image_card=image,
+                    image_detail=image,
+                )
+                for number in range(
+                    offset, min(offset + self.batch_size, total)
+                )
+            ]
+            self.write(
+                'Рецепты', Recipe, recipes, offset + len(recipes), started
+            )
+        return self.new_ids(Recipe, last_id)
+
+    def create_ingredient_amounts(self, recipe_ids, ingredient_ids, count):
+        started = time.monotonic()
+        batch = []
+        written = 0
+        for recipe_id in recipe_ids:
+            for ingredient_id in self.random.sample(ingredient_ids, count):
+                batch.append(IngredAmount(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_id,
+                    amount=self.random.randint(1, 500),
+                ))
+            if len(batch) >= self.batch_size:
+                written += len(batch)
+                self.write(
+                    'Ингредиенты рецептов', IngredAmount, batch,
+                    written, started,
+                )
+                batch = []
+        if batch:
+            written += len(batch)
+            self.write(
+                'Ингредиенты рецептов', IngredAmount, batch, written, started
+            )
+
+    def create_links(self, title, model, total, factory):
+        started = time.monotonic()
+        for offset in range(0, total, self.batch_size):
+            objects = [
+                factory()
+                for _ in range(offset, min(offset + self.batch_size, total))
+            ]
+            self.write(title, model, objects, offset + len(objects), started)
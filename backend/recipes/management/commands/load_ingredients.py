@@ -0,0 +1,179 @@
+import csv
+import io
+import json
+import re
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from recipes.cache import bump_version
+from recipes.ingredient_index import ingredient_index
+from recipes.models import Ingredient
+
+READ_SIZE = 64 * 1024
+SEPARATORS = re.compile(r'[\s,]*')
+
+
+def iter_json_array(file):
+    '''
+    Читает JSON-массив по частям и отдаёт элементы по одному,
+    не загружая весь файл в память.
+    '''
+    decoder = json.JSONDecoder()
+    buffer = file.read(READ_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидается JSON-массив.')
+    position = 1
+    end_of_file = False
+    while True:
+        position = SEPARATORS.match(buffer, position).end()
+        if buffer[position:position + 1] == ']':
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if end_of_file:
+                raise CommandError('Некорректный JSON.')
+            chunk = file.read(READ_SIZE)
+            end_of_file = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+
+
+def iter_json_rows(file):
+    '''
+    Строки (name, measurement_unit) из списка ингредиентов
+    или из фикстуры dumpdata (берутся только recipes.ingredient).
+    '''
+    for item in iter_json_array(file):
+        if 'model' in item:
+            if item['model'] != 'recipes.ingredient':
+                continue
+            item = item['fields']
+        yield item['name'], item['measurement_unit']
+
+
+def iter_csv_rows(file, delimiter):
+    for row in csv.reader(file, delimiter=delimiter):
+        if len(row) < 2 or row[:2] == ['name', 'measurement_unit']:
+            continue
+        yield row[0], row[1]
+
+
+def upsert(rows):
+    '''
+    INSERT ... ON CONFLICT (name) DO UPDATE для пачки строк.
+    Повторы внутри пачки схлопываются, иначе PostgreSQL
+    откажется обновлять одну строку дважды. Строки с той же
+    единицей измерения не перезаписываются. Возвращает число
+    строк в пачке и число добавленных или изменённых.
+    '''
+    rows = list(dict(rows).items())
+    table = connection.ops.quote_name(Ingredient._meta.db_table)
+    values = ', '.join(['(%s, %s)'] * len(rows))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ("name", "measurement_unit") '
+            f'VALUES {values} ON CONFLICT ("name") '
+            'DO UPDATE SET "measurement_unit" = EXCLUDED."measurement_unit" '
+            f'WHERE {table}."measurement_unit" '
+            '<> EXCLUDED."measurement_unit"',
+            [value for row in rows for value in row],
+        )
+        return len(rows), cursor.rowcount
+
+
+def copy_upsert(rows):
+    '''
+    То же через COPY во временную таблицу (только PostgreSQL).
+    '''
+    rows = dict(rows)
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows.items())
+    buffer.seek(0)
+    table = connection.ops.quote_name(Ingredient._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE TEMP TABLE IF NOT EXISTS "ingredients_load" '
+            '("name" varchar(100), "measurement_unit" varchar(20)) '
+            'ON COMMIT DELETE ROWS'
+        )
+        cursor.copy_expert(
+            'COPY "ingredients_load" FROM STDIN WITH (FORMAT csv)', buffer
+        )
+        cursor.execute(
+            f'INSERT INTO {table} ("name", "measurement_unit") '
+            'SELECT "name", "measurement_unit" FROM "ingredients_load" '
+            'ON CONFLICT ("name") '
+            'DO UPDATE SET "measurement_unit" = EXCLUDED."measurement_unit" '
+            f'WHERE {table}."measurement_unit" '
+            '<> EXCLUDED."measurement_unit"'
+        )
+        return len(rows), cursor.rowcount
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает ингредиенты из JSON или CSV по частям. '
+        'Повторная загрузка обновляет единицы измерения.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу .json или .csv')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Сколько строк записывать за один запрос.',
+        )
+        parser.add_argument(
+            '--delimiter',
+            default=',',
+            help='Разделитель полей CSV.',
+        )
+        parser.add_argument(
+            '--copy',
+            action='store_true',
+            help='Загружать через COPY (только PostgreSQL).',
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден.')
+        if options['copy'] and connection.vendor != 'postgresql':
+            raise CommandError('COPY доступен только для PostgreSQL.')
+        write = copy_upsert if options['copy'] else upsert
+        total = changed = 0
+        started = time.monotonic()
+        with path.open(encoding='utf-8', newline='') as file:
+            if path.suffix.lower() == '.csv':
+                rows = iter_csv_rows(file, options['delimiter'])
+            else:
+                rows = iter_json_rows(file)
+            while True:
+                batch = list(islice(rows, options['batch_size']))
+                if not batch:
+                    break
+                with transaction.atomic():
+                    written, updated = write(batch)
+                total += written
+                changed += updated
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'{total} строк, {total / max(elapsed, 1e-6):.0f} строк/с'
+                )
+        if changed:
+            ingredient_index.invalidate()
+            bump_version(Ingredient)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено {total} строк, изменено {changed}, '
+            f'за {elapsed:.2f} с '
+            f'({total / max(elapsed, 1e-6):.0f} строк/с).'
+        ))
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.jobs import claim_job, queue_stats, run_job
+
+
+class Command(BaseCommand):
+    help = 'Обрабатывает очередь картинок рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Обработать очередь и завершиться.',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=1.0,
+            help='Пауза между опросами пустой очереди, секунды.',
+        )
+        parser.add_argument(
+            '--stats',
+            action='store_true',
+            help='Показать состояние очереди и завершиться.',
+        )
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            for name, value in queue_stats().items():
+                self.stdout.write(f'{name}: {value}')
+            return
+        while True:
+            job = claim_job()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['sleep'])
+                continue
+            if run_job(job):
+                self.stdout.write(f'Задание {job.pk} выполнено.')
+            else:
+                self.stderr.write(f'Задание {job.pk}: {job.error}')
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from recipes.cart import rebuild_cart_totals
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает итоги списков покупок по текущему содержимому '
+        'ShoppingCart (после правок ингредиентов через админку, '
+        'массовой загрузки данных и т. п.).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='users',
+            help='id пользователя; можно указать несколько раз.',
+        )
+
+    def handle(self, *args, **options):
+        rebuild_cart_totals(options['users'])
+        self.stdout.write('Итоги списков покупок пересчитаны.')
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from recipes.feed import rebuild_feeds
+
+
+class Command(BaseCommand):
+    help = (
+        'Раскладывает по лентам подписчиков рецепты, которые '
+        'ещё не были разосланы (созданные до появления лент, '
+        'через админку или generate_data).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        fanned = rebuild_feeds(options['batch_size'])
+        self.stdout.write(f'Разослано рецептов: {fanned}')
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from recipes.cache import bump_version
+from recipes.models import Recipe
+from recipes.queries import reconcile_recipe_counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает favorites_count и in_carts_count рецептов '
+        'и исправляет расхождения.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько рецептов проверять за одну транзакцию.',
+        )
+
+    def handle(self, *args, **options):
+        fixed = reconcile_recipe_counters(options['batch_size'])
+        if fixed:
+            bump_version(Recipe)
+        self.stdout.write(f'Исправлено рецептов: {fixed}')
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from recipes.trending import update_trending
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает рейтинг популярных рецептов по накопленным '
+        'добавлениям в избранное и в списки покупок и удалениям из них.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Пересчитать рейтинг заново по всем данным.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        updated = update_trending(
+            rebuild=options['rebuild'], batch_size=options['batch_size']
+        )
+        self.stdout.write(f'Обновлено рецептов: {updated}')
@@ -0,0 +1,45 @@
+from django.db import migrations
+
+FORWARD_SQL = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    '''CREATE INDEX IF NOT EXISTS "recipes_search_vector_idx"
+       ON "Recipes" USING gin (
+           to_tsvector(
+               'russian'::regconfig,
+               COALESCE("name", '') || ' ' || COALESCE("text", '')
+           )
+       )''',
+    '''CREATE INDEX IF NOT EXISTS "ingredients_name_prefix_idx"
+       ON "Ingredients" (UPPER("name"::text) text_pattern_ops)''',
+    '''CREATE INDEX IF NOT EXISTS "ingredients_name_trgm_idx"
+       ON "Ingredients" USING gin (UPPER("name"::text) gin_trgm_ops)''',
+]
+
+REVERSE_SQL = [
+    'DROP INDEX IF EXISTS "ingredients_name_trgm_idx"',
+    'DROP INDEX IF EXISTS "ingredients_name_prefix_idx"',
+    'DROP INDEX IF EXISTS "recipes_search_vector_idx"',
+]
+
+
+def run_on_postgresql(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_auto_20211214_1017'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_on_postgresql(FORWARD_SQL),
+            run_on_postgresql(REVERSE_SQL),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 3.2 on 2026-10-18 20:24
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Sum
+
+from recipes.units import normalize
+
+
+def fill_cart_totals(apps, schema_editor):
+    IngredAmount = apps.get_model('recipes', 'IngredAmount')
+    CartTotal = apps.get_model('recipes', 'CartTotal')
+    rows = IngredAmount.objects.filter(recipe__cart__isnull=False).values_list(
+        'recipe__cart__user', 'ingredient_id', 'ingredient__measurement_unit'
+    ).annotate(total=Sum('amount')).order_by()
+    totals = defaultdict(float)
+    for user_id, ingredient_id, unit, amount in rows.iterator():
+        amount, unit = normalize(amount, unit)
+        totals[user_id, ingredient_id, unit] += amount
+    CartTotal.objects.bulk_create(
+        [
+            CartTotal(
+                user_id=user_id, ingredient_id=ingredient_id,
+                measurement_unit=unit, amount=amount,
+            )
+            for (user_id, ingredient_id, unit), amount in totals.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0011_feed_items'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('measurement_unit', models.CharField(max_length=20, verbose_name='Единица измерения')),
+                ('amount', models.FloatField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_totals', to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_totals', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Итог списка покупок',
+                'verbose_name_plural': 'Итоги списков покупок',
+                'db_table': 'CartTotals',
+                'ordering': ['ingredient'],
+            },
+        ),
+        migrations.RunPython(fill_cart_totals, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='carttotal',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient', 'measurement_unit'), name='cart_total_unique'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.2 on 2026-10-18 20:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_cart_totals'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='trendingstate',
+            name='last_cart_id',
+        ),
+        migrations.RemoveField(
+            model_name='trendingstate',
+            name='last_favorite_id',
+        ),
+        migrations.CreateModel(
+            name='TrendEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('favorite', 'Избранное'), ('cart', 'Список покупок')], max_length=8, verbose_name='Источник')),
+                ('delta', models.SmallIntegerField(verbose_name='Изменение')),
+                ('created', models.DateTimeField(verbose_name='Время добавления')),
+                ('recipe', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='recipes.recipe', verbose_name='Рецепт')),
+            ],
+            options={
+                'verbose_name': 'Событие рейтинга',
+                'verbose_name_plural': 'События рейтинга',
+                'db_table': 'TrendEvents',
+            },
+        ),
+    ]
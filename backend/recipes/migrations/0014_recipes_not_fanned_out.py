@@ -0,0 +1,26 @@
+# Generated by Django 3.2 on 2026-10-18 21:10
+
+from django.db import migrations, models
+
+
+def flag_pull_authors(apps, schema_editor):
+    CustomUser = apps.get_model('users', 'CustomUser')
+    CustomUser.objects.filter(recipes__fanned_out=False).update(
+        feed_pull=True
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_feed_pull'),
+        ('recipes', '0013_trend_events'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(fanned_out=False), fields=['author', '-pub_date'], name='recipes_not_fanned_out_idx'),
+        ),
+        migrations.RunPython(flag_pull_authors, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
 from django.core import validators
 from django.db import models
+from django.utils import timezone
 
 from .fields import ColorField
 from users.models import CustomUser
@@ -92,6 +93,16 @@ class Recipe(models.Model):
         max_length=500,
     )
     image = models.ImageField(upload_to="images/")
+    image_card = models.ImageField(
+        upload_to="images/",
+        blank=True,
+        verbose_name='Картинка для карточки',
+    )
+    image_detail = models.ImageField(
+        upload_to="images/",
+        blank=True,
+        verbose_name='Картинка для страницы рецепта',
+    )
     text = models.TextField(
         max_length=5000,
         verbose_name='Текст рецепта',
@@ -110,12 +121,42 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Дата публикации'
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном',
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В списках покупок',
+    )
+    fanned_out = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='Разослан в ленты подписчиков',
+    )
 
     class Meta:
         verbose_name = 'Рецепты'
         verbose_name_plural = 'Рецепты'
         db_table = 'Recipes'
-        ordering = ['-id']
+        ordering = ['-pub_date', '-id']
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipes_pub_date_id_idx',
+            ),
+            models.Index(
+                fields=['-favorites_count', '-id'],
+                name='recipes_favorites_count_idx',
+            ),
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='recipes_not_fanned_out_idx',
+                condition=models.Q(fanned_out=False),
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -175,6 +216,10 @@ class ShoppingCart(models.Model):
         related_name='cart',
         on_delete=models.CASCADE
     )
+    created = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Добавлено в список покупок',
+    )
 
     class Meta:
         db_table = 'ShoppingCarts'
@@ -206,6 +251,10 @@ class Favorite(models.Model):
         verbose_name='Рецепты',
         on_delete=models.CASCADE,
     )
+    created = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Добавлено в избранное',
+    )
 
     class Meta:
         db_table = 'Favoritesource'
@@ -221,3 +270,233 @@ class Favorite(models.Model):
 
     def __str__(self):
         return f'{self.user}: {self.recipe}'
+
+
+class ImageJob(models.Model):
+    '''Задание на обработку картинки рецепта.'''
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+    CHOICES_STATUS = [
+        (PENDING, 'В очереди'),
+        (PROCESSING, 'Обрабатывается'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    ]
+    recipe = models.ForeignKey(
+        Recipe,
+        verbose_name='Рецепт',
+        related_name='image_jobs',
+        on_delete=models.CASCADE,
+    )
+    source = models.FileField(
+        upload_to='uploads/',
+        verbose_name='Исходный файл',
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=CHOICES_STATUS,
+        default=PENDING,
+        verbose_name='Статус',
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name='Попыток',
+    )
+    error = models.TextField(
+        blank=True,
+        verbose_name='Ошибка',
+    )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Поставлено в очередь',
+    )
+    started = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Начало обработки',
+    )
+    finished = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Конец обработки',
+    )
+
+    class Meta:
+        db_table = 'ImageJobs'
+        verbose_name = 'Обработка картинки'
+        verbose_name_plural = 'Обработка картинок'
+        ordering = ['id']
+        indexes = [
+            models.Index(
+                fields=['status', 'id'],
+                name='image_job_status_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.status}'
+
+
+class RecipeTrend(models.Model):
+    '''
+    Рейтинг популярности рецепта: сумма весов добавлений
+    в избранное и в списки покупок с экспоненциальным затуханием.
+    Вес события хранится относительно TrendingState.epoch,
+    поэтому новые события просто прибавляются к score.
+    '''
+    recipe = models.OneToOneField(
+        Recipe,
+        primary_key=True,
+        related_name='trend',
+        verbose_name='Рецепт',
+        on_delete=models.CASCADE,
+    )
+    score = models.FloatField(
+        default=0,
+        verbose_name='Рейтинг',
+    )
+
+    class Meta:
+        db_table = 'RecipeTrends'
+        verbose_name = 'Рейтинг рецепта'
+        verbose_name_plural = 'Рейтинг рецептов'
+        ordering = ['-score', '-recipe']
+        indexes = [
+            models.Index(
+                fields=['-score', '-recipe'],
+                name='recipe_trend_score_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.score}'
+
+
+class TrendingState(models.Model):
+    '''Состояние пересчёта рейтинга: эпоха и время пересчёта.'''
+    epoch = models.DateTimeField(default=timezone.now)
+    updated = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'TrendingState'
+        verbose_name = 'Состояние рейтинга'
+        verbose_name_plural = 'Состояние рейтинга'
+
+
+class TrendEvent(models.Model):
+    '''
+    Ещё не учтённое в рейтинге добавление (delta=1) или удаление
+    (delta=-1) рецепта из избранного или списка покупок. created -
+    время добавления: удаление вычитает ровно тот вес, который
+    добавление внесло. Пересчёт удаляет обработанные строки.
+    Внешний ключ без ограничения в БД: при удалении рецепта события
+    его избранного пишутся в той же транзакции.
+    '''
+    FAVORITE = 'favorite'
+    CART = 'cart'
+    SOURCES = [
+        (FAVORITE, 'Избранное'),
+        (CART, 'Список покупок'),
+    ]
+
+    recipe = models.ForeignKey(
+        Recipe,
+        verbose_name='Рецепт',
+        related_name='+',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+    )
+    source = models.CharField(
+        max_length=8, choices=SOURCES, verbose_name='Источник'
+    )
+    delta = models.SmallIntegerField(verbose_name='Изменение')
+    created = models.DateTimeField(verbose_name='Время добавления')
+
+    class Meta:
+        db_table = 'TrendEvents'
+        verbose_name = 'Событие рейтинга'
+        verbose_name_plural = 'События рейтинга'
+
+
+class FeedItem(models.Model):
+    '''
+    Рецепт в ленте подписчика автора. Заполняется при публикации
+    рецепта (fan-out on write), на подписчика хранится не больше
+    FEED_SIZE последних рецептов.
+    '''
+    user = models.ForeignKey(
+        CustomUser,
+        verbose_name='Подписчик',
+        related_name='feed_items',
+        on_delete=models.CASCADE,
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        verbose_name='Рецепт',
+        related_name='feed_items',
+        on_delete=models.CASCADE,
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        db_table = 'FeedItems'
+        verbose_name = 'Рецепт в ленте'
+        verbose_name_plural = 'Ленты подписок'
+        ordering = ['-pub_date', '-recipe']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='feed_item_unique',
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_item_user_pub_date_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}: {self.recipe_id}'
+
+
+class CartTotal(models.Model):
+    '''
+    Итог списка покупок пользователя по ингредиенту в базовой
+    единице измерения (г, мл). Меняется при добавлении и удалении
+    рецептов из списка покупок.
+    '''
+    user = models.ForeignKey(
+        CustomUser,
+        verbose_name='Пользователь',
+        related_name='cart_totals',
+        on_delete=models.CASCADE,
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        verbose_name='Ингредиент',
+        related_name='cart_totals',
+        on_delete=models.CASCADE,
+    )
+    measurement_unit = models.CharField(
+        max_length=20,
+        verbose_name='Единица измерения',
+    )
+    amount = models.FloatField(verbose_name='Количество')
+
+    class Meta:
+        db_table = 'CartTotals'
+        verbose_name = 'Итог списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+        ordering = ['ingredient']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient', 'measurement_unit'],
+                name='cart_total_unique',
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient_id}: {self.amount} {self.measurement_unit}'
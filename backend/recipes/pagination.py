@@ -1,6 +1,24 @@
+import base64
+import hashlib
+import json
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.views import Response
 
+from .cache import get_versions
+from foodgram.metrics import record_cache
+
 
 class PageNumberPaginationDataOnly(PageNumberPagination):
 
@@ -8,5 +26,231 @@ class PageNumberPaginationDataOnly(PageNumberPagination):
         return Response(data)
 
 
+class KeysetPagination:
+    '''
+    Постраничная выдача по ключу (keyset/cursor).
+    Курсор хранит значения полей сортировки последнего объекта
+    страницы, следующая страница выбирается условием по этим
+    значениям, поэтому её стоимость не зависит от номера страницы.
+    '''
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def __init__(self, ordering, page_size, cursor_query_param):
+        self.ordering = ordering
+        self.page_size = page_size
+        self.cursor_query_param = cursor_query_param
+
+    @staticmethod
+    def encode_value(value):
+        '''Даты сохраняются с микросекундами, иначе ключ теряет точность.'''
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        return str(value)
+
+    def encode_cursor(self, position, reverse):
+        data = json.dumps([position, reverse], default=self.encode_value)
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    def decode_cursor(self, value):
+        try:
+            position, reverse = json.loads(base64.urlsafe_b64decode(value))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or (
+            len(position) != len(self.ordering)
+        ):
+            raise NotFound(self.invalid_cursor_message)
+        for value in position:
+            if isinstance(value, bool) or not isinstance(
+                value, (str, int, float)
+            ):
+                raise NotFound(self.invalid_cursor_message)
+        return position, bool(reverse)
+
+    def get_position(self, obj):
+        return [getattr(obj, field.lstrip('-')) for field in self.ordering]
+
+    def position_filter(self, position, reverse):
+        '''
+        Условие "строго после position" для составного ключа:
+        (a < x) OR (a = x AND b < y) OR ...
+        '''
+        conditions = []
+        for index, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != reverse
+            operator = 'lt' if descending else 'gt'
+            lookup = {f'{name}__{operator}': position[index]}
+            equal = {
+                previous.lstrip('-'): position[number]
+                for number, previous in enumerate(self.ordering[:index])
+            }
+            conditions.append(Q(**equal, **lookup))
+        return reduce(or_, conditions)
+
+    def paginate_queryset(self, queryset, request):
+        self.request = request
+        value = request.query_params.get(self.cursor_query_param)
+        position, reverse = None, False
+        if value:
+            position, reverse = self.decode_cursor(value)
+        ordering = self.ordering
+        if reverse:
+            ordering = [
+                field[1:] if field.startswith('-') else f'-{field}'
+                for field in ordering
+            ]
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            # Значения приводятся к типам полей уже в filter():
+            # строка вместо числа или даты - это тоже неверный курсор.
+            try:
+                queryset = queryset.filter(
+                    self.position_filter(position, reverse)
+                )
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+        page = list(queryset[:self.page_size + 1])
+        has_more = len(page) > self.page_size
+        page = page[:self.page_size]
+        if reverse:
+            page.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page = page
+        return page
+
+    def get_link(self, obj, reverse):
+        url = self.request.build_absolute_uri()
+        cursor = self.encode_cursor(self.get_position(obj), reverse)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.get_link(self.page[-1], False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.get_link(self.page[0], True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+def estimated_count(queryset):
+    '''
+    Оценка числа строк таблицы по статистике PostgreSQL (reltuples).
+    Только для выдачи без фильтров и только для больших таблиц,
+    иначе None.
+    '''
+    connection = connections[queryset.db]
+    query = queryset.query
+    if (
+        connection.vendor != 'postgresql'
+        or query.has_filters()
+        or query.distinct
+    ):
+        return None
+    table = connection.ops.quote_name(queryset.model._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            [table],
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] < settings.PAGINATION_COUNT_ESTIMATE_THRESHOLD:
+        return None
+    return row[0]
+
+
+class CachedCountPaginator(Paginator):
+    '''
+    Paginator, который не считает COUNT(*) на каждый запрос:
+    количество берётся из кеша по count_key, а для больших
+    таблиц без фильтров - из статистики PostgreSQL.
+    '''
+
+    def __init__(self, *args, count_key=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count_key = count_key
+
+    @cached_property
+    def count(self):
+        if self.count_key is None:
+            return Paginator.count.func(self)
+        count = cache.get(self.count_key)
+        record_cache('pagination_count', count is not None)
+        if count is None:
+            count = estimated_count(self.object_list)
+            if count is None:
+                count = Paginator.count.func(self)
+            cache.set(
+                self.count_key, count,
+                timeout=settings.PAGINATION_COUNT_TIMEOUT,
+            )
+        return count
+
+
 class CustomPagination(PageNumberPagination):
+    '''
+    Постраничная выдача по номеру страницы (по умолчанию).
+    Если в запросе есть параметр cursor (в том числе пустой),
+    выдача идёт по ключу сортировки view.cursor_ordering.
+    '''
     page_size_query_param = "limit"
+    cursor_query_param = 'cursor'
+    cursor_ordering = ('-id',)
+    keyset = None
+    view = None
+
+    def django_paginator_class(self, queryset, page_size):
+        return CachedCountPaginator(
+            queryset, page_size, count_key=self.get_count_key(queryset)
+        )
+
+    def get_count_key(self, queryset):
+        '''
+        Ключ кеша количества: SQL запроса (все фильтры, включая
+        зависящие от пользователя) и версии данных моделей,
+        от которых зависит выдача (view.count_cache_models).
+        Избранное, список покупок и подписки фильтруют выдачу
+        только по текущему пользователю, поэтому их изменения
+        другими пользователями ключ не меняют.
+        '''
+        try:
+            sql, params = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            return None
+        models = {queryset.model}
+        models.update(getattr(self.view, 'count_cache_models', ()))
+        user = self.request.user
+        versions = ':'.join(map(str, get_versions(
+            sorted(models, key=lambda m: m._meta.label_lower),
+            user.pk if user.is_authenticated else None,
+        )))
+        digest = hashlib.md5(f'{sql}{params}'.encode()).hexdigest()
+        return f'count:{queryset.model._meta.label_lower}:{versions}:{digest}'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.view = view
+        if self.cursor_query_param not in request.query_params:
+            return super().paginate_queryset(queryset, request, view)
+        self.keyset = KeysetPagination(
+            getattr(view, 'cursor_ordering', self.cursor_ordering),
+            self.get_page_size(request),
+            self.cursor_query_param,
+        )
+        return self.keyset.paginate_queryset(queryset, request)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,93 @@
+from django.db import transaction
+from django.db.models import (Count, F, IntegerField, OuterRef, Q, Subquery,
+                              Window)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce, RowNumber
+
+from .models import Favorite, Recipe, ShoppingCart
+
+RECIPE_COUNTERS = {
+    'favorites_count': Favorite,
+    'in_carts_count': ShoppingCart,
+}
+
+
+def latest_recipes(author_ids, limit=None):
+    '''
+    Рецепты авторов author_ids, не больше limit последних
+    на каждого автора, одним запросом с
+    ROW_NUMBER() OVER (PARTITION BY author).
+    '''
+    queryset = Recipe.objects.filter(author__in=author_ids)
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        return queryset
+    if not author_ids:
+        # Пустой author__in не строит SQL (EmptyResultSet).
+        return queryset
+    ranked = queryset.annotate(
+        row_number=Window(
+            expression=RowNumber(),
+            partition_by=[F('author')],
+            order_by=[
+                F(field[1:]).desc() if field.startswith('-') else F(field)
+                for field in Recipe._meta.ordering
+            ],
+        )
+    ).order_by().values('id', 'row_number')
+    sql, params = ranked.query.sql_with_params()
+    return Recipe.objects.filter(id__in=RawSQL(
+        f'SELECT "id" FROM ({sql}) AS "ranked" WHERE "row_number" <= %s',
+        (*params, limit),
+    ))
+
+
+def count_relations(model):
+    '''Подзапрос: сколько строк model ссылается на рецепт.'''
+    return Coalesce(
+        Subquery(
+            model.objects.filter(recipe=OuterRef('pk'))
+            .order_by().values('recipe')
+            .annotate(total=Count('pk')).values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def reconcile_recipe_counters(batch_size=1000):
+    '''
+    Пересчитывает favorites_count и in_carts_count
+    по диапазонам id, обновляя только разошедшиеся строки.
+    Возвращает число исправленных рецептов.
+    '''
+    ids = Recipe.objects.order_by('pk').values_list('pk', flat=True)
+    last_id = 0
+    fixed = 0
+    while True:
+        upper = ids.filter(pk__gt=last_id)[batch_size - 1:batch_size]
+        upper = next(iter(upper), None)
+        batch = Recipe.objects.filter(pk__gt=last_id)
+        if upper is not None:
+            batch = batch.filter(pk__lte=upper)
+        actual = {
+            f'actual_{field}': count_relations(model)
+            for field, model in RECIPE_COUNTERS.items()
+        }
+        drifted = Q()
+        for field in RECIPE_COUNTERS:
+            drifted |= ~Q(**{field: F(f'actual_{field}')})
+        with transaction.atomic():
+            stale = list(
+                batch.annotate(**actual).filter(drifted)
+                .select_for_update().values_list('pk', flat=True)
+            )
+            if stale:
+                fixed += Recipe.objects.filter(pk__in=stale).update(**{
+                    field: count_relations(model)
+                    for field, model in RECIPE_COUNTERS.items()
+                })
+        if upper is None:
+            return fixed
+        last_id = upper
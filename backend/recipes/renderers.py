@@ -0,0 +1,64 @@
+import abc
+import csv
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class ShoppingListRenderer(BaseRenderer, metaclass=abc.ABCMeta):
+    '''
+    Базовый рендерер списка покупок: подклассы задают stream.
+    Ответы с ошибками отдаются как JSON.
+    '''
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, list):
+            return json.dumps(data, ensure_ascii=False)
+        return ''.join(self.stream(data))
+
+    @abc.abstractmethod
+    def stream(self, rows):
+        '''Части файла по строкам списка rows.'''
+
+
+class Echo:
+    '''Буфер, который отдаёт записанную строку вместо её хранения.'''
+
+    def write(self, value):
+        return value
+
+
+class PlainTextShoppingListRenderer(ShoppingListRenderer):
+    '''Список покупок в виде текстового файла.'''
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, rows):
+        yield 'Список ингредиентов\n'
+        for row in rows:
+            yield '{name}: {amount} {measurement_unit}\n'.format(**row)
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    '''Список покупок в виде CSV-файла.'''
+    media_type = 'text/csv'
+    format = 'csv'
+    header = ('name', 'amount', 'measurement_unit')
+
+    def stream(self, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.header)
+        for row in rows:
+            yield writer.writerow([row[field] for field in self.header])
+
+
+class JSONShoppingListRenderer(JSONRenderer):
+    '''Список покупок в виде JSON-массива.'''
+
+    def stream(self, rows):
+        separator = '['
+        for row in rows:
+            yield separator + json.dumps(row, ensure_ascii=False)
+            separator = ','
+        yield ']' if separator == ',' else '[]'
@@ -1,8 +1,9 @@
-from django.shortcuts import get_object_or_404
-from drf_extra_fields.fields import Base64ImageField
+from django.db import transaction
 from rest_framework import serializers
 
-
+from .cart import defer_cart_rebuild
+from .images import RecipeImageField
+from .jobs import enqueue_image_job
 from .models import (Favorite, IngredAmount, Ingredient, Recipe, ShoppingCart,
                      Tag)
 from .validators import CustomRecipeValidator, ValidatorAuthorRecipe
@@ -50,7 +51,7 @@ class RecipeSerializer(serializers.ModelSerializer):
         many=True,
         read_only=True
     )
-    image = Base64ImageField(max_length=None, use_url=True)
+    image = RecipeImageField(max_length=None, use_url=True)
     cooking_time = serializers.FloatField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
@@ -92,65 +93,107 @@ class RecipeSerializer(serializers.ModelSerializer):
         )
         request = self.context.get('request')
         if request.method == 'PATCH' or request.method == 'DELETE':
-            recipe_id = self.context['view'].kwargs.get('pk')
-            recipe = Recipe.objects.filter(id=recipe_id)[0]
-            author = recipe.author
+            author = self.instance.author
             user = request.user
             ValidatorAuthorRecipe().__call__(
                 data, author, user,
             )
         return data
 
+    @transaction.atomic
     def create(self, data):
         '''
         Обновленный метод создания рецептов.
         '''
         tags = data.pop('tags')
         ingredients = data.pop('ingredients')
-        image = data.pop('image')
-        recipe = Recipe.objects.create(image=image, **data)
+        image_source = data.pop('image_source', None)
+        recipe = Recipe.objects.create(**data)
         self.add_tags_to_recipe(tags, recipe)
         self.update_ingredients_in_recipe(ingredients, recipe)
+        if image_source is not None:
+            enqueue_image_job(recipe, image_source)
         return recipe
 
+    @transaction.atomic
     def update(self, recipe: Recipe, data):
         '''
         Обновленный метод обновления рецептов.
         '''
         ingredients = data.pop('ingredients')
         tags_data = data.pop('tags')
+        image_source = data.pop('image_source', None)
         ret = super().update(recipe, data)
+        if image_source is not None:
+            enqueue_image_job(ret, image_source)
         if ingredients:
-            ret.ingredients.clear()
-            self.update_ingredients_in_recipe(ingredients, ret)
+            # bulk_create и bulk_update идут мимо сигналов.
+            with defer_cart_rebuild() as changed:
+                self.update_ingredients_in_recipe(ingredients, ret)
+                changed.add(ret.pk)
         if tags_data:
             ret.tags.set(tags_data)
-        ret.save()
         return ret
 
     @staticmethod
     def add_tags_to_recipe(tags, recipe):
         '''Добавляет данные по тэгам.'''
-        for tag_id in tags:
-            recipe.tags.add(get_object_or_404(Tag, pk=tag_id))
+        tags_in_db = Tag.objects.in_bulk(tags)
+        if len(tags_in_db) < len(set(tags)):
+            raise serializers.ValidationError('Такого тэга нет в базе.')
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for tag in tags_in_db.values()
+        ])
 
     @staticmethod
     def update_ingredients_in_recipe(ingredients, recipe):
-        '''Добавляет данные по рецептам'''
-        for ingredient in ingredients:
-            IngredAmount.objects.create(
+        '''
+        Приводит ингредиенты рецепта к переданному списку:
+        лишние удаляются, новые добавляются, у остальных
+        обновляется количество.
+        '''
+        amounts = {
+            int(ingredient.get('id')): ingredient.get('amount')
+            for ingredient in ingredients
+        }
+        ingredients_in_db = Ingredient.objects.in_bulk(amounts.keys())
+        if len(ingredients_in_db) < len(amounts):
+            raise serializers.ValidationError(
+                'Такого ингредиента нет в базе.'
+            )
+        existing = {
+            item.ingredient_id: item
+            for item in IngredAmount.objects.filter(recipe=recipe)
+        }
+        removed = existing.keys() - amounts.keys()
+        if removed:
+            IngredAmount.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        changed = []
+        for ingredient_id, item in existing.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and item.amount != amount:
+                item.amount = amount
+                changed.append(item)
+        IngredAmount.objects.bulk_update(changed, ['amount'])
+        IngredAmount.objects.bulk_create([
+            IngredAmount(
                 recipe=recipe,
-                ingredient=get_object_or_404(
-                    Ingredient,
-                    pk=ingredient.get('id')
-                ),
-                amount=ingredient.get('amount')
+                ingredient=ingredients_in_db[ingredient_id],
+                amount=amount,
             )
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in existing
+        ])
 
     def get_is_favorited(self, obj):
         '''
         Проверяет наличие рецепта в списке избранного.
         '''
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get("request")
         if request is None or request.user.is_anonymous:
             return False
@@ -162,6 +205,8 @@ class RecipeSerializer(serializers.ModelSerializer):
         '''
         Проверяет наличие рецепта в списке покупок.
         '''
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get("request")
         if request is None or request.user.is_anonymous:
             return False
@@ -193,7 +238,7 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
 
 class FavoriteSerializer(serializers.ModelSerializer):
     '''Сериализатор данных по рецептам в избранное.'''
-    image = Base64ImageField(read_only=True)
+    image = RecipeImageField(variant='image_card', read_only=True)
 
     class Meta:
         model = Recipe
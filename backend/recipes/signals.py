@@ -0,0 +1,106 @@
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from .cache import bump_version_on_commit, version_user
+from .cart import recipe_ingredients_changed, update_cart_totals
+from .ingredient_index import ingredient_index
+from .models import (Favorite, IngredAmount, Ingredient, Recipe,
+                     ShoppingCart, Tag)
+from .queries import RECIPE_COUNTERS
+from .trending import record_event
+from .utils import update_counter
+from users.models import CustomUser, Follow
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_index(**kwargs):
+    '''Сбрасывает индекс автодополнения при изменении ингредиентов.'''
+    ingredient_index.invalidate()
+
+
+def recipe_counter(sender, instance):
+    field = next(
+        field for field, model in RECIPE_COUNTERS.items() if model is sender
+    )
+    return Recipe.objects.filter(pk=instance.recipe_id), field
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def count_saved_relation(sender, instance, created, raw=False, **kwargs):
+    '''
+    Избранное и список покупок, созданные мимо add_relation
+    (в админке, через save()), тоже увеличивают счётчики рецепта
+    и попадают в рейтинг популярных.
+    Данные loaddata (raw) приходят уже с посчитанными счётчиками.
+    '''
+    if created and not raw:
+        update_counter(recipe_counter(sender, instance), 1)
+        record_event(instance, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def count_deleted_relation(sender, instance, **kwargs):
+    '''Любое удаление, в том числе каскадное и из админки,
+    уменьшает счётчики и рейтинг рецепта.'''
+    update_counter(recipe_counter(sender, instance), -1)
+    record_event(instance, -1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_saved_cart(sender, instance, created, raw=False, **kwargs):
+    '''
+    Рецепт, добавленный в список покупок мимо add_relation,
+    прибавляется к итогам списка.
+    '''
+    if created and not raw:
+        update_cart_totals(instance.user_id, instance.recipe_id, 1)
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def subtract_deleted_cart(sender, instance, **kwargs):
+    '''
+    Любое удаление из списка покупок, в том числе каскадное при
+    удалении рецепта или пользователя, вычитает рецепт из итогов.
+    pre_delete: ингредиенты рецепта ещё на месте.
+    '''
+    update_cart_totals(instance.user_id, instance.recipe_id, -1)
+
+
+@receiver(post_save, sender=IngredAmount)
+@receiver(post_delete, sender=IngredAmount)
+def rebuild_ingredient_carts(sender, instance, raw=False, **kwargs):
+    '''Правка ингредиентов рецепта меняет итоги списков с ним.'''
+    if not raw:
+        recipe_ingredients_changed(instance.recipe_id)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def bump_model_version(sender, instance, **kwargs):
+    '''
+    Сбрасывает закешированные данные по модели:
+    ответы справочников и количество объектов в выдаче.
+    '''
+    bump_version_on_commit(sender, version_user(sender, instance))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_recipe_version(**kwargs):
+    '''Изменение тэгов рецепта меняет выдачу с фильтром по тэгам.'''
+    bump_version_on_commit(Recipe)
@@ -0,0 +1,846 @@
+import base64
+import io
+import json
+import os
+import shutil
+import tempfile
+from importlib import import_module
+
+from asgiref.testing import ApplicationCommunicator
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.backends.postgresql.base import \
+    DatabaseWrapper as PostgresWrapper
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.filters import SearchFilter
+from rest_framework.test import APIClient
+
+from .cache import get_version
+from .cart import defer_cart_rebuild
+from .feed import rebuild_feeds
+from .filters import IngredientFilter
+from .ingredient_index import ingredient_index
+from .jobs import claim_job, run_job
+from .models import (CartTotal, Favorite, ImageJob, IngredAmount, Ingredient,
+                     Recipe, RecipeTrend, ShoppingCart, Tag, TrendEvent)
+from .renderers import (CSVShoppingListRenderer,
+                        PlainTextShoppingListRenderer, ShoppingListRenderer)
+from .serializers import RecipeSerializer
+from .trending import update_trending
+from foodgram.async_views import StreamingASGIHandler
+from users.authentication import local_tokens
+from users.models import CustomUser, Follow
+
+
+def create_user(name):
+    return CustomUser.objects.create_user(
+        username=name, email=f'{name}@foodgram.ru', password='pass12345x'
+    )
+
+
+def token_client(user):
+    client = APIClient()
+    client.credentials(
+        HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key
+    )
+    return client
+
+
+def create_recipe(author, tags, ingredients, name='Рецепт', amount=10):
+    recipe = Recipe.objects.create(
+        author=author, name=name, text='Текст', cooking_time=5,
+        image='images/recipe.png',
+    )
+    recipe.tags.set(tags)
+    IngredAmount.objects.bulk_create([
+        IngredAmount(recipe=recipe, ingredient=ingredient, amount=amount)
+        for ingredient in ingredients
+    ])
+    return recipe
+
+
+class FoodgramTestCase(TestCase):
+    '''Общие данные: автор, читатель, теги и ингредиенты.'''
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.user = create_user('reader')
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {i}', slug=f'tag{i}', color=color)
+            for i, color in enumerate((Tag.BLUE, Tag.GREEN))
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(3)
+        ]
+
+    def reset_caches(self):
+        # Счётчики страниц, справочники и токены кешируются,
+        # а тестам на число запросов нужен одинаковый старт.
+        cache.clear()
+        local_tokens.clear()
+        ingredient_index.invalidate()
+
+    def setUp(self):
+        self.reset_caches()
+        self.anonymous = APIClient()
+        self.client = token_client(self.user)
+
+
+class RecipeQueryCountTest(FoodgramTestCase):
+    '''
+    Число SQL-запросов списка и карточки рецепта не зависит
+    от размера страницы: связанные данные грузятся пачками.
+    '''
+    page_sizes = (2, 10)
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.recipes = [
+            create_recipe(cls.author, cls.tags, cls.ingredients, f'R{i}')
+            for i in range(12)
+        ]
+
+    def assert_list_queries(self, client, queries):
+        for size in self.page_sizes:
+            with self.subTest(limit=size):
+                self.reset_caches()
+                with self.assertNumQueries(queries):
+                    response = client.get(f'/api/recipes/?limit={size}')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()['results']), size)
+
+    def test_list_anonymous(self):
+        self.assert_list_queries(self.anonymous, 6)
+
+    def test_list_authenticated(self):
+        self.assert_list_queries(self.client, 7)
+
+    def test_retrieve_anonymous(self):
+        with self.assertNumQueries(5):
+            response = self.anonymous.get(
+                f'/api/recipes/{self.recipes[0].id}/'
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_retrieve_authenticated(self):
+        with self.assertNumQueries(6):
+            response = self.client.get(f'/api/recipes/{self.recipes[0].id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()['is_favorited'])
+
+
+class CartTotalsTest(FoodgramTestCase):
+    '''Итоги списков покупок после правки общего рецепта.'''
+
+    def test_rebuild_with_recipe_in_two_carts(self):
+        other = create_user('other')
+        other_client = token_client(other)
+        recipe = create_recipe(
+            self.author, self.tags, self.ingredients[:1], amount=100
+        )
+        for client in (self.client, other_client):
+            response = client.get(f'/api/recipes/{recipe.id}/shopping_cart/')
+            self.assertEqual(response.status_code, 201)
+        response = token_client(self.author).patch(
+            f'/api/recipes/{recipe.id}/',
+            {
+                'name': recipe.name,
+                'text': recipe.text,
+                'cooking_time': 5,
+                'ingredients': [
+                    {'id': self.ingredients[0].id, 'amount': 200},
+                ],
+                'tags': [tag.id for tag in self.tags],
+            },
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        for user in (self.user, other):
+            self.assertEqual(
+                list(CartTotal.objects.filter(user=user).values_list(
+                    'ingredient', 'amount'
+                )),
+                [(self.ingredients[0].id, 200.0)],
+            )
+
+
+class CartTotalsSignalsTest(FoodgramTestCase):
+    '''Итоги списков покупок при изменениях мимо API.'''
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = create_recipe(
+            self.author, self.tags, self.ingredients[:2], amount=100
+        )
+        response = self.client.get(
+            f'/api/recipes/{self.recipe.id}/shopping_cart/'
+        )
+        self.assertEqual(response.status_code, 201)
+
+    def totals(self):
+        return dict(CartTotal.objects.filter(user=self.user).values_list(
+            'ingredient', 'amount'
+        ))
+
+    def test_delete_through_orm(self):
+        ShoppingCart.objects.filter(user=self.user).delete()
+        self.assertEqual(self.totals(), {})
+
+    def test_recipe_deleted(self):
+        Recipe.objects.filter(pk=self.recipe.pk).delete()
+        self.assertEqual(self.totals(), {})
+
+    def test_ingredients_changed_through_orm(self):
+        IngredAmount.objects.filter(
+            recipe=self.recipe, ingredient=self.ingredients[0]
+        ).update(amount=300)
+        amount = IngredAmount.objects.get(
+            recipe=self.recipe, ingredient=self.ingredients[1]
+        )
+        amount.amount = 50
+        amount.save()
+        IngredAmount.objects.create(
+            recipe=self.recipe, ingredient=self.ingredients[2], amount=7
+        )
+        # update() идёт мимо сигналов, save() пересчитывает весь список.
+        self.assertEqual(self.totals(), {
+            self.ingredients[0].id: 300.0,
+            self.ingredients[1].id: 50.0,
+            self.ingredients[2].id: 7.0,
+        })
+        amount.delete()
+        self.assertNotIn(self.ingredients[1].id, self.totals())
+
+    def test_added_through_orm(self):
+        other = create_user('other')
+        ShoppingCart.objects.create(user=other, recipe=self.recipe)
+        self.assertEqual(
+            CartTotal.objects.filter(user=other).count(), 2
+        )
+
+
+class IngredientDiffTest(FoodgramTestCase):
+    '''Обновление рецепта пишет только изменившиеся ингредиенты.'''
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = create_recipe(
+            self.author, self.tags, self.ingredients[:2]
+        )
+
+    def update(self, amounts):
+        with defer_cart_rebuild():
+            with CaptureQueriesContext(connection) as queries:
+                RecipeSerializer.update_ingredients_in_recipe([
+                    {'id': ingredient.id, 'amount': amount}
+                    for ingredient, amount in amounts
+                ], self.recipe)
+        return [
+            query['sql'].split()[0] for query in queries.captured_queries
+        ]
+
+    def rows(self):
+        return dict(IngredAmount.objects.filter(
+            recipe=self.recipe
+        ).values_list('ingredient', 'pk'))
+
+    def test_unchanged_rows_stay(self):
+        first, second, third = self.ingredients
+        kept = self.rows()[second.id]
+        statements = self.update([(second, 10), (third, 5)])
+        # Третий SELECT - удаляемые строки для сигнала post_delete.
+        self.assertEqual(
+            statements, ['SELECT', 'SELECT', 'SELECT', 'DELETE', 'INSERT']
+        )
+        rows = self.rows()
+        self.assertEqual(rows.keys(), {second.id, third.id})
+        self.assertEqual(rows[second.id], kept)
+
+    def test_same_ingredients_write_nothing(self):
+        statements = self.update([(self.ingredients[0], 10),
+                                  (self.ingredients[1], 10)])
+        self.assertEqual(statements, ['SELECT', 'SELECT'])
+
+    def test_changed_amount_is_updated_in_place(self):
+        rows = self.rows()
+        statements = self.update([(self.ingredients[0], 10),
+                                  (self.ingredients[1], 20)])
+        self.assertEqual(statements, ['SELECT', 'SELECT', 'UPDATE'])
+        self.assertEqual(self.rows(), rows)
+        self.assertEqual(IngredAmount.objects.get(
+            pk=rows[self.ingredients[1].id]
+        ).amount, 20)
+
+
+class RecipeCountersTest(FoodgramTestCase):
+    '''Счётчики избранного и списков покупок у рецепта.'''
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = create_recipe(self.author, self.tags, self.ingredients)
+        self.url = f'/api/recipes/{self.recipe.id}/favorite/'
+
+    def counters(self):
+        self.recipe.refresh_from_db()
+        return self.recipe.favorites_count, self.recipe.in_carts_count
+
+    def test_toggle(self):
+        self.assertEqual(self.client.get(self.url).status_code, 201)
+        self.assertEqual(self.counters(), (1, 0))
+        self.assertEqual(self.client.delete(self.url).status_code, 204)
+        self.assertEqual(self.counters(), (0, 0))
+
+    def test_relations_created_outside_views(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        cart = ShoppingCart.objects.create(user=self.user, recipe=self.recipe)
+        self.assertEqual(self.counters(), (1, 1))
+        cart.delete()
+        self.assertEqual(self.client.delete(self.url).status_code, 204)
+        self.assertEqual(self.counters(), (0, 0))
+
+    def test_drifted_counter_does_not_break_delete(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        Recipe.objects.filter(pk=self.recipe.pk).update(favorites_count=0)
+        self.assertEqual(self.client.delete(self.url).status_code, 204)
+        self.assertEqual(self.counters(), (0, 0))
+        self.assertFalse(Favorite.objects.exists())
+
+
+class CountCacheTest(FoodgramTestCase):
+    '''Кеш количества рецептов в постраничной выдаче.'''
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = create_recipe(self.author, self.tags, self.ingredients)
+
+    def get_list(self, client, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/api/recipes/', params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()['count']
+
+    def test_other_user_toggle_keeps_count(self):
+        uncached, _ = self.get_list(self.anonymous)
+        cached = self.get_list(self.anonymous)
+        self.assertLess(cached[0], uncached)
+        other = token_client(create_user('other'))
+        for relation in ('favorite', 'shopping_cart'):
+            response = other.get(f'/api/recipes/{self.recipe.id}/{relation}/')
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.get_list(self.anonymous), cached)
+
+    def test_own_toggle_changes_filtered_count(self):
+        for relation, param in (
+            ('favorite', 'is_favorited'),
+            ('shopping_cart', 'is_in_shopping_cart'),
+        ):
+            with self.subTest(relation=relation):
+                url = f'/api/recipes/{self.recipe.id}/{relation}/'
+                params = {param: 1}
+                self.assertEqual(self.get_list(self.client, params)[1], 0)
+                self.assertEqual(self.client.get(url).status_code, 201)
+                self.assertEqual(self.get_list(self.client, params)[1], 1)
+                # Версию при удалении меняет сигнал после фиксации.
+                with self.captureOnCommitCallbacks(execute=True):
+                    response = self.client.delete(url)
+                self.assertEqual(response.status_code, 204)
+                self.assertEqual(self.get_list(self.client, params)[1], 0)
+
+
+class ReferenceCacheTest(FoodgramTestCase):
+    '''ETag и условные запросы к справочникам.'''
+    urls = ('/api/tags/', '/api/ingredients/')
+
+    def test_not_modified(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.anonymous.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('Last-Modified', response)
+                etag = response['ETag']
+                response = self.anonymous.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+                self.assertEqual(response['ETag'], etag)
+
+    def test_etag_changes_after_data_change(self):
+        changes = {
+            '/api/tags/': lambda: Tag.objects.create(
+                name='Новый', slug='new', color=Tag.BLUE
+            ),
+            '/api/ingredients/': lambda: Ingredient.objects.create(
+                name='Новый', measurement_unit='г'
+            ),
+        }
+        for url, change in changes.items():
+            with self.subTest(url=url):
+                etag = self.anonymous.get(url)['ETag']
+                with self.captureOnCommitCallbacks(execute=True):
+                    change()
+                response = self.anonymous.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+
+
+class IngredientIndexTest(FoodgramTestCase):
+    '''Автодополнение ингредиентов по префиксу из индекса в памяти.'''
+
+    def search(self, params):
+        response = self.anonymous.get('/api/ingredients/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_prefix_from_index(self):
+        expected = self.search({'name': 'Ингредиент', 'ordering': '-id'})
+        self.assertEqual(len(expected), 3)
+        # Индекс загружается одним запросом при первом обращении.
+        with self.assertNumQueries(1):
+            self.assertEqual(self.search({'name': 'Ингредиент'}), expected)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.search({'name': 'Ингредиент 1'}), [
+                {'id': self.ingredients[1].id, 'name': 'Ингредиент 1',
+                 'measurement_unit': 'г'},
+            ])
+            self.assertEqual(self.search({'name': 'ингредиент'}), [])
+
+    def test_other_params_use_database(self):
+        self.search({'name': 'Ингредиент'})
+        with CaptureQueriesContext(connection) as queries:
+            found = self.search({'name': 'Ингредиент', 'ordering': 'name'})
+        self.assertTrue(queries.captured_queries)
+        self.assertEqual(
+            [ingredient['name'] for ingredient in found],
+            sorted(ingredient.name for ingredient in self.ingredients),
+        )
+
+    def test_invalidated_after_change(self):
+        self.search({'name': 'Ингредиент'})
+        added = Ingredient.objects.create(
+            name='Ингредиент новый', measurement_unit='кг'
+        )
+        renamed = self.ingredients[0]
+        renamed.name = 'Соль'
+        renamed.save()
+        self.assertEqual(
+            [ingredient['id'] for ingredient in self.search(
+                {'name': 'Ингредиент'}
+            )],
+            [added.id, self.ingredients[2].id, self.ingredients[1].id],
+        )
+        self.assertEqual(
+            self.search({'name': 'Со'}),
+            [{'id': renamed.id, 'name': 'Соль', 'measurement_unit': 'г'}],
+        )
+
+
+class LoadIngredientsTest(FoodgramTestCase):
+    '''Повторная загрузка ингредиентов.'''
+
+    def load(self, rows):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'ingredients.json')
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(rows, file, ensure_ascii=False)
+        output = io.StringIO()
+        call_command('load_ingredients', path, stdout=output)
+        return output.getvalue()
+
+    def test_reload_changes_nothing(self):
+        rows = [
+            {'name': 'Соль', 'measurement_unit': 'г'},
+            {'name': 'Ингредиент 0', 'measurement_unit': 'кг'},
+            {'name': 'Ингредиент 1', 'measurement_unit': 'г'},
+            {'name': 'Соль', 'measurement_unit': 'г'},
+        ]
+        self.assertIn('Загружено 3 строк, изменено 2,', self.load(rows))
+        loaded = list(Ingredient.objects.values_list(
+            'id', 'name', 'measurement_unit'
+        ))
+        self.assertEqual(len(loaded), 4)
+        version = get_version(Ingredient)
+        self.assertIn('Загружено 3 строк, изменено 0,', self.load(rows))
+        self.assertEqual(
+            list(Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            )),
+            loaded,
+        )
+        self.assertEqual(get_version(Ingredient), version)
+
+
+class CursorPaginationTest(FoodgramTestCase):
+    '''Выдача рецептов по курсору.'''
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for i in range(3):
+            create_recipe(cls.author, cls.tags, cls.ingredients, f'R{i}')
+
+    def get(self, cursor):
+        return self.anonymous.get('/api/recipes/', {
+            'cursor': cursor, 'limit': 2,
+        })
+
+    def test_next_page(self):
+        response = self.get('')
+        self.assertEqual(response.status_code, 200)
+        next_page = self.anonymous.get(response.json()['next'])
+        self.assertEqual(len(next_page.json()['results']), 1)
+
+    def test_invalid_cursor(self):
+        positions = (
+            [{'pub_date': 1}, 1],
+            [['2021-01-01'], 1],
+            [True, 1],
+            ['not a date', 1],
+            ['2021-01-01T00:00:00', 'not a number'],
+        )
+        for position in positions:
+            cursor = base64.urlsafe_b64encode(
+                json.dumps([position, False]).encode()
+            ).decode()
+            with self.subTest(position=position):
+                self.assertEqual(self.get(cursor).status_code, 404)
+
+
+class FeedTest(FoodgramTestCase):
+    '''Лента подписок.'''
+
+    def setUp(self):
+        super().setUp()
+        self.author_client = token_client(self.author)
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+
+    def create_recipe(self, name):
+        image = io.BytesIO()
+        Image.new('RGB', (10, 10), 'red').save(image, 'PNG')
+        data = {
+            'name': name,
+            'text': 'Текст',
+            'cooking_time': 5,
+            'image': 'data:image/png;base64,'
+                     + base64.b64encode(image.getvalue()).decode(),
+            'ingredients': [{'id': self.ingredients[0].id, 'amount': 10}],
+            'tags': [self.tags[0].id],
+        }
+        with override_settings(MEDIA_ROOT=self.media_root):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.author_client.post(
+                    '/api/recipes/', data, format='json'
+                )
+        self.assertEqual(response.status_code, 201, response.content)
+        return Recipe.objects.get(pk=response.json()['id'])
+
+    def test_author_without_followers(self):
+        recipe = self.create_recipe('Без подписчиков')
+        self.assertTrue(recipe.fanned_out)
+
+    def test_order_and_cursor(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        names = [self.create_recipe(f'R{i}').name for i in range(3)]
+        response = self.client.get('/api/recipes/feed/', {
+            'cursor': '', 'limit': 2,
+        })
+        page = response.json()
+        self.assertEqual(
+            [recipe['name'] for recipe in page['results']], ['R2', 'R1']
+        )
+        page = self.client.get(page['next']).json()
+        self.assertEqual(
+            [recipe['name'] for recipe in page['results']], names[:1]
+        )
+
+    def test_read_does_not_query_recipes_by_author(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        for i in range(3):
+            self.create_recipe(f'R{i}')
+        self.reset_caches()
+        with CaptureQueriesContext(connection) as queries:
+            with self.assertNumQueries(7):
+                response = self.client.get('/api/recipes/feed/')
+        self.assertEqual(response.json()['count'], 3)
+        for query in queries.captured_queries:
+            self.assertNotIn('"fanned_out" = ', query['sql'])
+
+    def test_pull_author(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        with override_settings(FEED_FANOUT_LIMIT=0):
+            recipe = self.create_recipe('Для всех')
+        self.assertFalse(recipe.fanned_out)
+        self.author.refresh_from_db()
+        self.assertTrue(self.author.feed_pull)
+        response = self.client.get('/api/recipes/feed/')
+        self.assertEqual(response.json()['results'][0]['id'], recipe.id)
+        self.assertEqual(rebuild_feeds(), 1)
+        self.author.refresh_from_db()
+        self.assertFalse(self.author.feed_pull)
+
+
+class TrendingTest(FoodgramTestCase):
+    '''Рейтинг популярных рецептов.'''
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = create_recipe(self.author, self.tags, self.ingredients)
+        self.url = f'/api/recipes/{self.recipe.id}/favorite/'
+        update_trending()
+
+    def score(self):
+        trend = RecipeTrend.objects.filter(recipe=self.recipe).first()
+        return trend and trend.score
+
+    def test_removal_lowers_score(self):
+        self.assertEqual(self.client.get(self.url).status_code, 201)
+        update_trending()
+        self.assertAlmostEqual(self.score(), 1.0, places=3)
+        self.assertEqual(self.client.delete(self.url).status_code, 204)
+        update_trending()
+        self.assertIsNone(self.score())
+        self.assertFalse(TrendEvent.objects.exists())
+
+    def test_event_committed_out_of_order(self):
+        self.assertEqual(self.client.get(self.url).status_code, 201)
+        update_trending()
+        # Транзакция с меньшим id зафиксирована после пересчёта.
+        TrendEvent.objects.create(
+            id=1, recipe=self.recipe, source=TrendEvent.CART, delta=1,
+            created=Favorite.objects.get().created,
+        )
+        update_trending()
+        self.assertAlmostEqual(self.score(), 1.5, places=3)
+
+    def test_invalid_filter(self):
+        response = self.anonymous.get(
+            '/api/recipes/trending/', {'author': 'unknown'}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class StreamingDownloadTest(FoodgramTestCase):
+    '''Выгрузка списка покупок через ASGI.'''
+
+    def setUp(self):
+        super().setUp()
+        recipe = create_recipe(self.author, self.tags, self.ingredients)
+        response = self.client.get(f'/api/recipes/{recipe.id}/shopping_cart/')
+        self.assertEqual(response.status_code, 201)
+        self.token = Token.objects.get(user=self.user).key
+
+    async def test_streams_parts(self):
+        communicator = ApplicationCommunicator(StreamingASGIHandler(), {
+            'type': 'http',
+            'method': 'GET',
+            'path': '/api/recipes/download_shopping_cart/',
+            'query_string': b'format=txt',
+            'headers': [
+                (b'host', b'testserver'),
+                (b'authorization', f'Token {self.token}'.encode()),
+            ],
+        })
+        await communicator.send_input({'type': 'http.request'})
+        start = await communicator.receive_output()
+        self.assertEqual(start['status'], 200)
+        parts = []
+        while True:
+            message = await communicator.receive_output()
+            if not message.get('more_body'):
+                break
+            parts.append(message['body'])
+        # Каждая строка списка уходит отдельным сообщением.
+        self.assertEqual(len(parts), 1 + len(self.ingredients))
+        self.assertEqual(parts[0], 'Список ингредиентов\n'.encode())
+
+
+class BenchmarkApiTest(FoodgramTestCase):
+    '''Команда benchmark_api на маленьком наборе данных.'''
+
+    def test_small_dataset(self):
+        create_recipe(self.author, self.tags, self.ingredients)
+        output = io.StringIO()
+        call_command(
+            'benchmark_api', requests=1, host='testserver', json=True,
+            stdout=output,
+        )
+        self.assertIn('recipes-list-deep-page', json.loads(output.getvalue()))
+
+
+class ShoppingListRendererTest(SimpleTestCase):
+    '''Рендереры списка покупок.'''
+    rows = [{'name': 'Соль', 'amount': 5, 'measurement_unit': 'г'}]
+
+    def test_base_renderer_is_abstract(self):
+        with self.assertRaises(TypeError):
+            ShoppingListRenderer()
+
+    def test_render(self):
+        self.assertEqual(
+            PlainTextShoppingListRenderer().render(self.rows),
+            'Список ингредиентов\nСоль: 5 г\n',
+        )
+        self.assertEqual(
+            CSVShoppingListRenderer().render(self.rows),
+            'name,amount,measurement_unit\r\nСоль,5,г\r\n',
+        )
+
+
+class IngredientPrefixSqlTest(SimpleTestCase):
+    '''Поиск ингредиентов по префиксу попадает в индексы PostgreSQL.'''
+
+    def setUp(self):
+        settings = dict(
+            connections['default'].settings_dict,
+            ENGINE='django.db.backends.postgresql',
+        )
+        self.postgres = PostgresWrapper(settings, alias='postgres')
+
+    def where(self, queryset):
+        sql, params = queryset.query.get_compiler(
+            connection=self.postgres
+        ).as_sql()
+        return sql.split(' WHERE ')[1].split(' ORDER BY ')[0]
+
+    def test_name_filter_uses_like_index(self):
+        queryset = IngredientFilter(
+            {'name': 'Со'}, Ingredient.objects.all()
+        ).qs
+        self.assertEqual(
+            self.where(queryset), '"Ingredients"."name"::text LIKE %s'
+        )
+        editor = self.postgres.SchemaEditorClass(self.postgres)
+        self.assertIn(
+            '("name" varchar_pattern_ops)',
+            str(editor._create_like_index_sql(
+                Ingredient, Ingredient._meta.get_field('name')
+            )),
+        )
+
+    def test_search_uses_upper_index(self):
+        lookup = SearchFilter().construct_search('^name')
+        queryset = Ingredient.objects.filter(**{lookup: 'Со'})
+        self.assertEqual(
+            self.where(queryset),
+            'UPPER("Ingredients"."name"::text) LIKE UPPER(%s)',
+        )
+        search_indexes = import_module(
+            'recipes.migrations.0005_search_indexes'
+        )
+        self.assertTrue(any(
+            '(UPPER("name"::text) text_pattern_ops)' in statement
+            for statement in search_indexes.FORWARD_SQL
+        ))
+
+
+def image_data(color):
+    image = io.BytesIO()
+    Image.new('RGB', (10, 10), color).save(image, 'PNG')
+    return (
+        'data:image/png;base64,'
+        + base64.b64encode(image.getvalue()).decode()
+    )
+
+
+@override_settings(RECIPE_IMAGE_ASYNC=True)
+class ImageJobTest(FoodgramTestCase):
+    '''Обработка картинок рецептов в очереди.'''
+
+    def setUp(self):
+        super().setUp()
+        self.author_client = token_client(self.author)
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = self.settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        response = self.author_client.post(
+            '/api/recipes/', self.recipe_data('red'), format='json'
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        self.recipe = Recipe.objects.get(pk=response.json()['id'])
+
+    def recipe_data(self, color):
+        return {
+            'name': 'Рецепт',
+            'text': 'Текст',
+            'cooking_time': 5,
+            'image': image_data(color),
+            'ingredients': [{'id': self.ingredients[0].id, 'amount': 10}],
+            'tags': [self.tags[0].id],
+        }
+
+    def upload(self, color):
+        response = self.author_client.put(
+            f'/api/recipes/{self.recipe.pk}/', self.recipe_data(color),
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_stale_job_keeps_newer_upload(self):
+        stale = claim_job()
+        self.upload('blue')
+        placeholder = Recipe.objects.get(pk=self.recipe.pk).image.name
+        self.assertTrue(run_job(stale))
+        self.assertEqual(
+            Recipe.objects.get(pk=self.recipe.pk).image.name, placeholder
+        )
+        self.assertTrue(run_job(claim_job()))
+        with Recipe.objects.get(pk=self.recipe.pk).image.open() as image:
+            red, _, blue = Image.open(image).convert('RGB').getpixel((0, 0))
+        self.assertGreater(blue, red)
+
+    @override_settings(IMAGE_JOB_MAX_ATTEMPTS=1)
+    def test_final_failure_falls_back_to_source(self):
+        job = claim_job()
+        with job.source.open('rb') as source:
+            header = source.read(16)
+        with job.source.open('wb') as source:
+            source.write(header)
+        with self.assertLogs('recipes.jobs', 'ERROR'):
+            self.assertFalse(run_job(job))
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImageJob.FAILED)
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        self.assertEqual(
+            recipe.image.name,
+            f'images/{os.path.basename(job.source.name)}',
+        )
+        self.assertEqual(recipe.image_card, recipe.image)
+
+
+class ImageQueueStatsTest(FoodgramTestCase):
+    '''Состояние очереди картинок в админке и в метриках.'''
+
+    def setUp(self):
+        super().setUp()
+        recipe = create_recipe(self.author, self.tags, self.ingredients)
+        ImageJob.objects.create(recipe=recipe, source='sources/recipe.png')
+
+    def test_admin_changelist(self):
+        admin = CustomUser.objects.create_superuser(
+            username='admin', email='admin@foodgram.ru', password='pass12345x'
+        )
+        self.client.force_login(admin)
+        response = self.client.get('/admin/recipes/imagejob/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['queue_stats']['depth'], 1)
+        self.assertContains(response, 'В очереди: 1.')
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics(self):
+        response = self.anonymous.get(
+            '/api/metrics', HTTP_AUTHORIZATION='Bearer secret'
+        )
+        self.assertContains(
+            response, f'foodgram_image_jobs{{status="{ImageJob.PENDING}"}} 1.0'
+        )
@@ -0,0 +1,157 @@
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .cache import bump_version
+from .models import (Favorite, Recipe, RecipeTrend, ShoppingCart,
+                     TrendEvent, TrendingState)
+
+
+def decay_rate():
+    return math.log(2) / (settings.TRENDING_HALF_LIFE_HOURS * 3600)
+
+
+def event_weights():
+    return {
+        TrendEvent.FAVORITE: 1.0,
+        TrendEvent.CART: settings.TRENDING_CART_WEIGHT,
+    }
+
+
+TREND_SOURCES = {
+    Favorite: TrendEvent.FAVORITE,
+    ShoppingCart: TrendEvent.CART,
+}
+
+
+def record_event(relation, delta):
+    '''
+    Записывает для пересчёта рейтинга добавление (delta=1) или
+    удаление (delta=-1) связи избранного или списка покупок.
+    Вызывается в транзакции, которая меняет саму связь.
+    Прочие связи (подписки) рейтинг не меняют.
+    '''
+    source = TREND_SOURCES.get(type(relation))
+    if source is None:
+        return
+    TrendEvent.objects.create(
+        recipe_id=relation.recipe_id,
+        source=source,
+        delta=delta,
+        created=relation.created,
+    )
+
+
+def collect_scores(state, rate, batch_size):
+    '''
+    Вклад накопленных событий TrendEvent: delta * вес *
+    exp(rate * (время добавления - эпоха)) по рецептам.
+    Удаляет учтённые события по их id: события транзакций,
+    зафиксированных позже, дождутся следующего пересчёта.
+    '''
+    weights = event_weights()
+    scores = defaultdict(float)
+    processed = []
+    events = TrendEvent.objects.order_by('id').values_list(
+        'id', 'recipe_id', 'source', 'delta', 'created'
+    )
+    for event_id, recipe_id, source, delta, created in events.iterator(
+        chunk_size=batch_size
+    ):
+        age = (created - state.epoch).total_seconds()
+        scores[recipe_id] += delta * weights[source] * math.exp(rate * age)
+        processed.append(event_id)
+    for start in range(0, len(processed), batch_size):
+        TrendEvent.objects.filter(
+            id__in=processed[start:start + batch_size]
+        ).delete()
+    return scores
+
+
+def rebuild_scores(state, rate, batch_size):
+    '''
+    Рейтинг заново по текущим избранному и спискам покупок.
+    Накопленные события в нём уже учтены и удаляются.
+    '''
+    TrendEvent.objects.all().delete()
+    weights = event_weights()
+    scores = defaultdict(float)
+    for model, source in TREND_SOURCES.items():
+        events = model.objects.values_list('recipe_id', 'created')
+        for recipe_id, created in events.iterator(chunk_size=batch_size):
+            age = (created - state.epoch).total_seconds()
+            scores[recipe_id] += weights[source] * math.exp(rate * age)
+    return scores
+
+
+def rebase(state, now, rate):
+    '''
+    Переносит эпоху на now, домножая все рейтинги на коэффициент
+    затухания, чтобы веса новых событий не росли без предела,
+    и удаляет рецепты, чей рейтинг опустился ниже порога.
+    '''
+    factor = math.exp(-rate * (now - state.epoch).total_seconds())
+    RecipeTrend.objects.update(score=F('score') * factor)
+    RecipeTrend.objects.filter(
+        score__lt=settings.TRENDING_MIN_SCORE
+    ).delete()
+    state.epoch = now
+
+
+def update_trending(rebuild=False, batch_size=1000):
+    '''
+    Пересчитывает таблицу рейтинга RecipeTrend.
+    По умолчанию учитывает только накопленные события TrendEvent,
+    с rebuild считает всё заново по текущим избранному и спискам
+    покупок.
+    Возвращает число обновлённых рецептов.
+    '''
+    now = timezone.now()
+    rate = decay_rate()
+    with transaction.atomic():
+        state = TrendingState.objects.select_for_update().first()
+        if state is None or rebuild:
+            TrendingState.objects.all().delete()
+            RecipeTrend.objects.all().delete()
+            state = TrendingState(epoch=now)
+            scores = rebuild_scores(state, rate, batch_size)
+        else:
+            if now - state.epoch > timedelta(
+                hours=settings.TRENDING_REBASE_HOURS
+            ):
+                rebase(state, now, rate)
+            scores = collect_scores(state, rate, batch_size)
+        existing = RecipeTrend.objects.in_bulk(list(scores))
+        for recipe_id, score in scores.items():
+            if recipe_id in existing:
+                existing[recipe_id].score += score
+        RecipeTrend.objects.bulk_update(
+            existing.values(), ['score'], batch_size=batch_size
+        )
+        # Рецепты, удалённые после события, в рейтинг не попадают.
+        added = Recipe.objects.filter(
+            id__in=[
+                recipe_id for recipe_id, score in scores.items()
+                if recipe_id not in existing
+                and score >= settings.TRENDING_MIN_SCORE
+            ]
+        ).values_list('id', flat=True)
+        RecipeTrend.objects.bulk_create(
+            [
+                RecipeTrend(recipe_id=recipe_id, score=scores[recipe_id])
+                for recipe_id in added
+            ],
+            batch_size=batch_size,
+        )
+        RecipeTrend.objects.filter(
+            score__lt=settings.TRENDING_MIN_SCORE
+        ).delete()
+        state.updated = now
+        state.save()
+    bump_version(RecipeTrend)
+    return len(scores)
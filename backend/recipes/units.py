@@ -0,0 +1,35 @@
+# Единицы, которые можно перевести в базовую: единица -> (базовая, множитель).
+CONVERTIBLE_UNITS = {
+    'мг': ('г', 0.001),
+    'г': ('г', 1),
+    'кг': ('г', 1000),
+    'мл': ('мл', 1),
+    'л': ('мл', 1000),
+}
+
+# Крупные единицы для вывода, от большей к меньшей.
+DISPLAY_UNITS = {
+    'г': (('кг', 1000), ('г', 1)),
+    'мл': (('л', 1000), ('мл', 1)),
+}
+
+
+def normalize(amount, unit):
+    '''Переводит количество в базовую единицу (кг -> г, л -> мл).'''
+    unit = unit.strip()
+    base, factor = CONVERTIBLE_UNITS.get(unit.lower(), (unit, 1))
+    return amount * factor, base
+
+
+def pretty_number(amount):
+    amount = round(amount, 3)
+    return int(amount) if amount.is_integer() else amount
+
+
+def humanize(amount, unit):
+    '''Подбирает для вывода самую крупную единицу, в которой
+    количество не меньше единицы: 1500 г -> 1.5 кг.'''
+    for display_unit, factor in DISPLAY_UNITS.get(unit, ()):
+        if amount >= factor:
+            return pretty_number(amount / factor), display_unit
+    return pretty_number(amount), unit
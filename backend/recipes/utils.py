@@ -0,0 +1,99 @@
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.sql import InsertQuery
+from django.shortcuts import get_object_or_404
+from rest_framework import status
+from rest_framework.response import Response
+
+from .cache import bump_version, version_user
+from .trending import record_event
+
+
+def insert_ignore_conflicts(obj):
+    '''
+    Сохраняет новый объект одним запросом
+    INSERT ... ON CONFLICT DO NOTHING.
+    Возвращает False, если такая запись уже есть.
+    '''
+    opts = obj._meta
+    using = router.db_for_write(type(obj), instance=obj)
+    connection = connections[using]
+    query = InsertQuery(type(obj), ignore_conflicts=True)
+    query.insert_values(
+        [field for field in opts.local_concrete_fields
+         if not field.primary_key],
+        [obj],
+    )
+    compiler = query.get_compiler(using=using)
+    returning = connection.features.can_return_columns_from_insert
+    if returning:
+        compiler.returning_fields = [opts.pk]
+    with connection.cursor() as cursor:
+        for sql, params in compiler.as_sql():
+            cursor.execute(sql, params)
+        if returning:
+            row = cursor.fetchone()
+            if row is None:
+                return False
+            obj.pk = row[0]
+        else:
+            if cursor.rowcount < 1:
+                return False
+            obj.pk = connection.ops.last_insert_id(
+                cursor, opts.db_table, opts.pk.column
+            )
+    obj._state.adding = False
+    obj._state.db = using
+    return True
+
+
+def update_counter(counter, delta):
+    '''
+    Меняет счётчик counter = (queryset, поле) на delta
+    одним UPDATE ... SET поле = поле + delta.
+    Уменьшение не опускает счётчик ниже нуля: разошедшийся
+    счётчик не должен ронять удаление на CHECK (поле >= 0),
+    его чинит команда reconcile_recipe_counters.
+    '''
+    if counter is None:
+        return
+    queryset, field = counter
+    value = F(field) + delta
+    if delta < 0:
+        value = Greatest(value, 0)
+    queryset.update(**{field: value})
+
+
+def add_relation(obj, error, serialize, counter=None):
+    '''
+    Добавляет связь (избранное, список покупок, подписку).
+    201 с данными serialize(obj) или 400, если связь уже есть.
+    Вставка идёт мимо save() и сигнала post_save, поэтому
+    счётчик counter увеличивается и событие рейтинга пишется
+    здесь, в той же транзакции.
+    '''
+    with transaction.atomic():
+        if not insert_ignore_conflicts(obj):
+            return Response(
+                {'errors': error}, status=status.HTTP_400_BAD_REQUEST
+            )
+        update_counter(counter, 1)
+        record_event(obj, 1)
+    bump_version(type(obj), version_user(type(obj), obj))
+    return Response(serialize(obj), status=status.HTTP_201_CREATED)
+
+
+def delete_relation(queryset, error, parent_model, parent_pk):
+    '''
+    Удаляет связь.
+    204, если связь удалена, 404, если нет родительского объекта,
+    иначе 400. Счётчики рецептов уменьшают, а версии кеша меняют
+    сигналы post_delete (recipes.signals).
+    '''
+    with transaction.atomic():
+        deleted, _ = queryset.delete()
+    if deleted:
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    get_object_or_404(parent_model, pk=parent_pk)
+    return Response({'errors': error}, status=status.HTTP_400_BAD_REQUEST)
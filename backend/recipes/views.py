@@ -1,4 +1,7 @@
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import (BooleanField, Exists, F, OuterRef, Prefetch,
+                              Value)
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
@@ -6,18 +9,27 @@ from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.filters import OrderingFilter, SearchFilter
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework.views import Response
 
-from .filters import FilterRecipe, IngredientFilter
-from .models import (Favorite, IngredAmount, Ingredient, Recipe, ShoppingCart,
-                     Tag)
+from .cache import CachedReferenceMixin
+from .cart import defer_cart_rebuild, shopping_list, update_cart_totals
+from .feed import FEED_ORDERING, fan_out_recipe, feed_recipes
+from .filters import (FilterRecipe, IngredientFilter, RecipeSearchFilter,
+                      StableOrderingFilter)
+from .ingredient_index import ingredient_index
+from .models import (Favorite, FeedItem, IngredAmount, Ingredient, Recipe,
+                     RecipeTrend, ShoppingCart, Tag)
 from .pagination import CustomPagination, PageNumberPaginationDataOnly
+from .renderers import (CSVShoppingListRenderer, JSONShoppingListRenderer,
+                        PlainTextShoppingListRenderer)
 from .serializers import (FavoriteSerializer, IngredientSerializer,
                           RecipeSerializer, ShoppingCartSerializer,
                           TagSerializer)
+from .utils import add_relation, delete_relation
+from foodgram.async_views import AsyncReadMixin
+from users.models import CustomUser, Follow
 
 
-class RecipesViewSet(viewsets.ModelViewSet):
+class RecipesViewSet(AsyncReadMixin, viewsets.ModelViewSet):
     '''
     Возвращает данные по рецептам.
     Отвечает по адресам:
@@ -25,12 +37,16 @@ class RecipesViewSet(viewsets.ModelViewSet):
     'recipes/id/'
     'recipes/id/favorite/'
     'recipes/id/shopping_cart/'
+    'recipes/trending/'
+    'recipes/feed/'
     '''
     serializer_class = RecipeSerializer
     queryset = Recipe.objects.all()
     permission_classes = [AllowAny]
     filterset_class = FilterRecipe
-    filter_backends = (DjangoFilterBackend, OrderingFilter, SearchFilter, )
+    filter_backends = (
+        DjangoFilterBackend, StableOrderingFilter, RecipeSearchFilter,
+    )
     pagination_class = CustomPagination
     filterset_fields = (
         'is_favorited',
@@ -39,10 +55,68 @@ class RecipesViewSet(viewsets.ModelViewSet):
         'tags',
     )
     search_fields = ('name', 'text', 'ingredients__name')
-    ordering_fields = ('name', 'pub_date')
+    ordering_fields = (
+        'name', 'pub_date', 'favorites_count', 'in_carts_count',
+    )
+    cursor_ordering = ('-pub_date', '-id')
+    count_cache_models = (
+        Favorite, ShoppingCart, RecipeTrend, FeedItem, Follow,
+    )
+    card_image_actions = ('list', 'trending', 'feed')
+    async_actions = ('list', 'retrieve', 'download_shopping_cart')
+
+    def get_queryset(self):
+        '''
+        Собирает рецепты вместе со связанными данными и флагами
+        избранного, списка покупок и подписки для текущего пользователя.
+        '''
+        user = self.request.user
+        if user.is_anonymous:
+            is_subscribed = is_favorited = is_in_shopping_cart = Value(
+                False, output_field=BooleanField()
+            )
+        else:
+            is_subscribed = Exists(Follow.objects.filter(
+                user=user, author=OuterRef('pk')
+            ))
+            is_favorited = Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            ))
+            is_in_shopping_cart = Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            ))
+        return Recipe.objects.prefetch_related(
+            Prefetch(
+                'author',
+                queryset=CustomUser.objects.annotate(
+                    is_subscribed=is_subscribed
+                )
+            ),
+            'tags',
+            Prefetch(
+                'ingredients_amounts',
+                queryset=IngredAmount.objects.select_related('ingredient')
+            ),
+        ).annotate(
+            is_favorited=is_favorited,
+            is_in_shopping_cart=is_in_shopping_cart,
+        )
 
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        recipe = serializer.save(author=self.request.user)
+        transaction.on_commit(lambda: fan_out_recipe(recipe))
+        serializer.instance = self.get_queryset().get(pk=recipe.pk)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        # Итоги списков покупок вычитают сигналы удаления из списков,
+        # каскад по ингредиентам не должен пересчитывать их построчно.
+        with defer_cart_rebuild():
+            instance.delete()
+
+    def perform_update(self, serializer):
+        recipe = serializer.save()
+        serializer.instance = self.get_queryset().get(pk=recipe.pk)
 
     @action(
         detail=True,
@@ -56,22 +130,12 @@ class RecipesViewSet(viewsets.ModelViewSet):
         Доступно только авторизованным пользователям.
         '''
         recipe = get_object_or_404(Recipe, id=pk)
-        if Favorite.objects.filter(
-            user=request.user, recipe=recipe
-        ).exists():
-            data = {
-                'errors': 'Рецепт уже добавлен в избранное.'
-            }
-            return Response(data, status=status.HTTP_400_BAD_REQUEST)
-
-        favorite_cart = Favorite.objects.create(
-            user=request.user,
-            recipe=recipe
+        return add_relation(
+            Favorite(user=request.user, recipe=recipe),
+            'Рецепт уже добавлен в избранное.',
+            lambda favorite: FavoriteSerializer(recipe).data,
+            counter=(Recipe.objects.filter(pk=recipe.pk), 'favorites_count'),
         )
-        favorite_cart.save()
-        serializer = FavoriteSerializer(recipe)
-
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @favorite.mapping.delete
     def delete_favorite(self, request, pk=None):
@@ -79,22 +143,11 @@ class RecipesViewSet(viewsets.ModelViewSet):
         Реализует удаление рецепта из избранного.
         Доступно только авторизованным пользователям.
         '''
-        recipe = get_object_or_404(Recipe, id=pk)
-        if not Favorite.objects.filter(
-            user=request.user, recipe=recipe
-        ).exists():
-            data = {
-                'errors': 'Этого рецепта нет в избранном.'
-            }
-            return Response(data, status=status.HTTP_400_BAD_REQUEST)
-
-        favorite_cart = get_object_or_404(
-            Favorite,
-            user=request.user,
-            recipe=recipe
+        return delete_relation(
+            Favorite.objects.filter(user=request.user, recipe_id=pk),
+            'Этого рецепта нет в избранном.',
+            Recipe, pk,
         )
-        favorite_cart.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
         detail=True,
@@ -102,96 +155,114 @@ class RecipesViewSet(viewsets.ModelViewSet):
         permission_classes=[IsAuthenticated],
         name='Скачивание карты покупок',
     )
+    @transaction.atomic
     def shopping_cart(self, request, pk=None):
         '''
         Добавление рецепта в список покупок.
+        Итоги списка покупок пересчитываются в той же транзакции.
         Доступно только авторизованным пользователям.
         '''
         recipe = get_object_or_404(Recipe, id=pk)
-        if ShoppingCart.objects.filter(
-            user=request.user, recipe=recipe
-        ).exists():
-            data = {
-                'errors': 'Рецепт уже в списке покупок.'
-            }
-            return Response(data, status=status.HTTP_400_BAD_REQUEST)
-
-        shop_cart = ShoppingCart.objects.create(
-            user=request.user,
-            recipe=recipe
+        response = add_relation(
+            ShoppingCart(user=request.user, recipe=recipe),
+            'Рецепт уже в списке покупок.',
+            lambda shop_cart: ShoppingCartSerializer(
+                shop_cart,
+                context={'request': request}
+            ).data,
+            counter=(Recipe.objects.filter(pk=recipe.pk), 'in_carts_count'),
         )
-        shop_cart.save()
-        serializer = ShoppingCartSerializer(
-            shop_cart,
-            context={'request': request}
-        )
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        if response.status_code == status.HTTP_201_CREATED:
+            update_cart_totals(request.user.pk, recipe.pk, 1)
+        return response
 
     @shopping_cart.mapping.delete
+    @transaction.atomic
     def delete_shopping_cart(self, request, pk=None):
         '''
         Реализует удаление рецепта из избранного.
         Доступно только авторизованным пользователям.
         '''
-        recipe = get_object_or_404(Recipe, id=pk)
-        if not ShoppingCart.objects.filter(
-            user=request.user, recipe=recipe
-        ).exists():
-            data = {
-                'errors': 'Этого рецепта нет в списке покупок.'
-            }
-            return Response(data, status=status.HTTP_400_BAD_REQUEST)
-
-        shop_cart = get_object_or_404(
-            ShoppingCart,
-            user=request.user,
-            recipe=recipe
+        return delete_relation(
+            ShoppingCart.objects.filter(user=request.user, recipe_id=pk),
+            'Этого рецепта нет в списке покупок.',
+            Recipe, pk,
         )
-        shop_cart.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(
+        detail=False,
+        methods=['GET', ],
+        name='Популярные рецепты',
+    )
+    def trending(self, request):
+        '''
+        Популярные рецепты по таблице рейтинга RecipeTrend,
+        которую пересчитывает команда update_trending.
+        Фильтры по тегам, автору, избранному и списку покупок
+        работают так же, как в общем списке.
+        '''
+        self.cursor_ordering = ('-trend_score', '-id')
+        queryset = DjangoFilterBackend().filter_queryset(
+            request, self.get_queryset().filter(trend__isnull=False), self
+        ).annotate(
+            trend_score=F('trend__score')
+        ).order_by(*self.cursor_ordering)
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     @action(
         detail=False,
         methods=['GET', ],
         permission_classes=[IsAuthenticated],
+        name='Лента подписок',
+    )
+    def feed(self, request):
+        '''
+        Рецепты авторов, на которых подписан пользователь,
+        от новых к старым. Доступно только авторизованным
+        пользователям.
+        '''
+        self.cursor_ordering = FEED_ORDERING
+        queryset = feed_recipes(
+            self.get_queryset(), request.user
+        ).order_by(*self.cursor_ordering)
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=['GET', ],
+        permission_classes=[IsAuthenticated],
+        renderer_classes=[
+            PlainTextShoppingListRenderer,
+            CSVShoppingListRenderer,
+            JSONShoppingListRenderer,
+        ],
         name='Скачивание карты покупок',
     )
     def download_shopping_cart(self, request, pk=None):
         '''
         Реализует сохранение списка покупок.
+        Формат файла задаётся параметром format: txt, csv или json.
         Доступно только авторизованным пользователям.
         '''
-        shop_cart = IngredAmount.objects.filter(
-            recipe__cart__user=request.user).values_list(
-                'ingredient__name',
-                'amount',
-                'ingredient__measurement_unit',
-        )
-        shop_list = {}
-        for item in shop_cart:
-            name = item[0]
-            if name in shop_list:
-                shop_list[name]['amount'] += item[1]
-            else:
-                shop_list[name] = {
-                    'amount': item[1],
-                    'measurement_unit': item[2],
-                }
-
-        data = ['Список ингредиентов\n', ]
-        for key in shop_list.keys():
-            amount_res = (shop_list[key]['amount'])
-            unit = (shop_list[key]['measurement_unit'])
-            data.append(f'{key}: {amount_res} {unit}\n')
+        renderer = request.accepted_renderer
         date = timezone.now()
-        response = HttpResponse(data, 'Content-Type: text/plain')
+        response = StreamingHttpResponse(
+            renderer.stream(shopping_list(request.user)),
+            content_type=f'{renderer.media_type}; charset=utf-8',
+        )
         response['Content-Disposition'] = (
-            f'attachment; filename="shoplist_{date}.txt"'
+            f'attachment; filename="shoplist_{date}.{renderer.format}"'
         )
         return response
 
 
-class TagsViewSet(viewsets.ModelViewSet):
+class TagsViewSet(
+    AsyncReadMixin, CachedReferenceMixin, viewsets.ModelViewSet
+):
     '''
     Возвращает данные по тэгам.
     Отвечает по адресам:
@@ -204,7 +275,9 @@ class TagsViewSet(viewsets.ModelViewSet):
     pagination_class = PageNumberPaginationDataOnly
 
 
-class IngredientsViewSet(viewsets.ModelViewSet):
+class IngredientsViewSet(
+    AsyncReadMixin, CachedReferenceMixin, viewsets.ModelViewSet
+):
     '''
     Возвращает данные по ингедиентам.
     Отвечает по адресам:
@@ -218,6 +291,18 @@ class IngredientsViewSet(viewsets.ModelViewSet):
     pagination_class = PageNumberPaginationDataOnly
     search_fields = ('^name',)
     ordering_fields = ('name',)
+    index_query_params = {'name', 'page'}
+
+    def list(self, request, *args, **kwargs):
+        '''
+        Запросы автодополнения вида ?name=<префикс> обслуживаются
+        индексом в памяти процесса без обращения к базе данных.
+        '''
+        name = request.query_params.get('name')
+        if not name or set(request.query_params) - self.index_query_params:
+            return super().list(request, *args, **kwargs)
+        page = self.paginate_queryset(ingredient_index.startswith(name))
+        return self.get_paginated_response(page)
 
 
 class ShoppingCartViewSer(viewsets.ModelViewSet):
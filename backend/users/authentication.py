@@ -0,0 +1,120 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+
+class LocalLRU:
+    '''
+    Ограниченный по размеру кеш процесса с вытеснением давно
+    неиспользованных записей и коротким временем жизни записи.
+    '''
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+local_tokens = LocalLRU(
+    settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_LOCAL_TTL
+)
+
+
+def token_cache_key(key):
+    return f'token:{hashlib.sha256(key.encode()).hexdigest()}'
+
+
+def shared_cache():
+    '''
+    Общий для всех воркеров кеш токенов или None. LocMemCache
+    живёт в памяти процесса: сброс из сигналов дошёл бы только
+    до одного воркера, а остальные ещё TOKEN_CACHE_TIMEOUT секунд
+    пускали бы с отозванным токеном.
+    '''
+    cache = caches['default']
+    if isinstance(cache, LocMemCache):
+        return None
+    return cache
+
+
+def invalidate_token(key):
+    '''Убирает токен из кеша процесса и из общего кеша.'''
+    cache_key = token_cache_key(key)
+    local_tokens.delete(cache_key)
+    cache = shared_cache()
+    if cache is not None:
+        cache.delete(cache_key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    '''
+    TokenAuthentication без запроса к базе на каждый вызов API:
+    пара (пользователь, токен) берётся из кеша процесса, затем
+    из общего кеша (если кеш по умолчанию действительно общий,
+    см. shared_cache) и только при промахе - из базы.
+    Записи сбрасываются сигналами при удалении токена и при
+    сохранении пользователя; в других процессах gunicorn устаревшая
+    запись живёт не дольше TOKEN_CACHE_LOCAL_TTL секунд.
+    '''
+
+    def authenticate_credentials(self, key):
+        cache_key = token_cache_key(key)
+        credentials = local_tokens.get(cache_key)
+        if credentials is None:
+            credentials = self.get_shared(key, cache_key)
+            local_tokens.set(cache_key, credentials)
+        user, token = credentials
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+        return copy.copy(user), token
+
+    def get_shared(self, key, cache_key):
+        cache = shared_cache()
+        if cache is None:
+            return super().authenticate_credentials(key)
+        credentials = cache.get(cache_key)
+        if credentials is None:
+            credentials = super().authenticate_credentials(key)
+            cache.set(
+                cache_key, credentials, timeout=settings.TOKEN_CACHE_TIMEOUT
+            )
+        return credentials
@@ -46,6 +46,12 @@ class CustomUser(AbstractUser):
         verbose_name='Уровень аккаунта',
     )
 
+    feed_pull = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='Рецепты попадают в ленты при чтении',
+    )
+
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('role', 'username', 'password')
 
@@ -104,3 +110,9 @@ class Follow(models.Model):
                 name='unique_following'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['user', '-id'],
+                name='follow_user_id_idx',
+            ),
+        ]
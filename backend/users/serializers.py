@@ -1,7 +1,8 @@
 from django.contrib.auth import authenticate
 from djoser.serializers import UserCreateSerializer
-from drf_extra_fields.fields import Base64ImageField
+from recipes.images import RecipeImageField
 from recipes.models import Recipe
+from recipes.queries import latest_recipes
 from rest_framework import serializers
 
 from .models import CustomUser, Follow
@@ -42,6 +43,8 @@ class UserSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get("request")
         if (request is None or request.user.is_anonymous):
             return False
@@ -52,7 +55,7 @@ class UserSerializer(serializers.ModelSerializer):
 
 class RecipeSerializerForFollow(serializers.ModelSerializer):
     '''Сериализатор данных по рецептам.'''
-    image = Base64ImageField(read_only=True)
+    image = RecipeImageField(variant='image_card', read_only=True)
 
     class Meta:
         model = Recipe
@@ -114,19 +117,20 @@ class FollowSerializerView(serializers.ModelSerializer):
         ]
 
     def get_is_subscribed(self, obj):
-        return Follow.objects.filter(
-            user=obj.user, author=obj.author
-        ).exists()
+        return True
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        recipes_limit = request.GET.get('recipes_limit')
-        queryset = Recipe.objects.filter(author=obj.author)
-        if recipes_limit:
-            queryset = queryset[:int(recipes_limit)]
-        return RecipeSerializerForFollow(queryset, many=True).data
+        recipes = getattr(obj.author, 'subscription_recipes', None)
+        if recipes is None:
+            request = self.context.get('request')
+            recipes = latest_recipes(
+                [obj.author_id], request.GET.get('recipes_limit')
+            )
+        return RecipeSerializerForFollow(recipes, many=True).data
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return Recipe.objects.filter(author=obj.author).count()
 
 
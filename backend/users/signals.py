@@ -0,0 +1,30 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_token
+from .models import CustomUser
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(instance, **kwargs):
+    '''Выход из системы и удаление токена сбрасывают его кеш.'''
+    key = instance.key
+    invalidate_token(key)
+    transaction.on_commit(lambda: invalidate_token(key))
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_user_tokens(instance, **kwargs):
+    '''
+    Закешированный пользователь устаревает при сохранении.
+    Кеш сбрасывается и после фиксации транзакции, чтобы
+    параллельный запрос не закешировал старые данные.
+    '''
+    keys = list(Token.objects.filter(
+        user_id=instance.pk
+    ).values_list('key', flat=True))
+    for key in keys:
+        invalidate_token(key)
+    transaction.on_commit(lambda: [invalidate_token(key) for key in keys])
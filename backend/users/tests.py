@@ -0,0 +1,98 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .authentication import local_tokens, token_cache_key
+from .models import CustomUser, Follow
+from recipes.models import Recipe
+
+
+class CachedTokenAuthenticationTest(TestCase):
+    '''Кеш токенов и отзыв токена при выходе.'''
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        local_tokens.clear()
+        self.user = CustomUser.objects.create_user(
+            username='reader', email='reader@foodgram.ru',
+            password='pass12345x',
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+    def test_local_memory_cache_is_not_shared(self):
+        '''LocMemCache не общий для воркеров, и токены в него
+        не пишутся: иначе отзыв не дошёл бы до других процессов.'''
+        response = self.client.get('/api/users/me/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(cache.get(token_cache_key(self.token.key)))
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    }})
+    def test_logout_revokes_token(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+
+class SubscriptionsTest(TestCase):
+    '''Список подписок.'''
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.user = self.create_user('reader')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_user(self, username):
+        return CustomUser.objects.create_user(
+            username=username, email=f'{username}@foodgram.ru',
+            password='pass12345x',
+        )
+
+    def follow(self, username, recipes):
+        author = self.create_user(username)
+        Follow.objects.create(user=self.user, author=author)
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=author, name=f'{username} {i}', text='Текст',
+                cooking_time=5, image='images/recipe.png',
+            )
+            for i in range(recipes)
+        )
+
+    def get_subscriptions(self):
+        return self.client.get(
+            '/api/users/subscriptions/', {'recipes_limit': 2, 'limit': 10}
+        )
+
+    def test_without_subscriptions(self):
+        with self.assertNumQueries(1):
+            response = self.get_subscriptions()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [])
+
+    def test_query_count_does_not_grow_with_authors(self):
+        for i in range(3):
+            self.follow(f'author{i}', recipes=3)
+        with self.assertNumQueries(3):
+            response = self.get_subscriptions()
+        results = response.json()['results']
+        self.assertEqual(len(results), 3)
+        for author in results:
+            self.assertEqual(author['recipes_count'], 3)
+            self.assertEqual(len(author['recipes']), 2)
+            self.assertTrue(author['is_subscribed'])
+        self.follow('author3', recipes=1)
+        # Пагинация кеширует число подписок.
+        cache.clear()
+        with self.assertNumQueries(3):
+            self.assertEqual(
+                len(self.get_subscriptions().json()['results']), 4
+            )
@@ -1,6 +1,12 @@
+from django.db.models import (BooleanField, Count, Exists, OuterRef,
+                              Prefetch, Value, prefetch_related_objects)
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
+from foodgram.async_views import AsyncReadMixin
+from recipes.feed import backfill_feed, drop_from_feed
 from recipes.pagination import CustomPagination
+from recipes.queries import latest_recipes
+from recipes.utils import add_relation, delete_relation
 from rest_framework import status, viewsets
 from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
@@ -16,7 +22,7 @@ from .serializers import (AuthTokenSerializer, CustomUserCreateSerializer,
                           PasswordSerializer, UserSerializer)
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(AsyncReadMixin, viewsets.ModelViewSet):
     '''
     Возвращает данные по пользователям.
     Отвечает по адресам:
@@ -30,6 +36,18 @@ class UserViewSet(viewsets.ModelViewSet):
     filter_backends = (DjangoFilterBackend, OrderingFilter, SearchFilter, )
     pagination_class = CustomPagination
     permission_classes = [AllowAny, ]
+    async_actions = ('subscriptions',)
+
+    def get_queryset(self):
+        '''Добавляет к пользователям флаг подписки текущего пользователя.'''
+        user = self.request.user
+        if user.is_anonymous:
+            is_subscribed = Value(False, output_field=BooleanField())
+        else:
+            is_subscribed = Exists(Follow.objects.filter(
+                user=user, author=OuterRef('pk')
+            ))
+        return CustomUser.objects.annotate(is_subscribed=is_subscribed)
 
     def get_serializer_class(self):
         if self.request.method == 'GET':
@@ -84,8 +102,23 @@ class UserViewSet(viewsets.ModelViewSet):
         Возвращает пользователей, на которых подписан текущий пользователь.
         В выдачу добавляются рецепты.
         '''
-        queryset = Follow.objects.filter(user=request.user)
+        queryset = Follow.objects.filter(
+            user=request.user
+        ).select_related('author').annotate(
+            recipes_count=Count('author__recipes')
+        ).order_by(*Follow._meta.ordering)
         page = self.paginate_queryset(queryset)
+        prefetch_related_objects(
+            [follow.author for follow in page],
+            Prefetch(
+                'recipes',
+                queryset=latest_recipes(
+                    [follow.author_id for follow in page],
+                    request.query_params.get('recipes_limit'),
+                ),
+                to_attr='subscription_recipes',
+            )
+        )
         serializer = FollowSerializerView(
             page,
             many=True,
@@ -108,46 +141,31 @@ class UserViewSet(viewsets.ModelViewSet):
                 'errors': 'Нельзя подписаться на самого себя.'
             }
             return Response(data, status=status.HTTP_400_BAD_REQUEST)
-        if Follow.objects.filter(
-            user=request.user,
-            author=author.id
-        ).exists():
-            data = {
-                'errors': 'Подписка уже существует'
-            }
-            return Response(data, status=status.HTTP_400_BAD_REQUEST)
-
-        follow = Follow.objects.create(user=request.user, author=author)
-        follow.save()
-
-        serializer = FollowSerializer(
-            follow,
-            context={'request': request}
+        response = add_relation(
+            Follow(user=request.user, author=author),
+            'Подписка уже существует',
+            lambda follow: FollowSerializer(
+                follow,
+                context={'request': request}
+            ).data,
         )
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        if response.status_code == status.HTTP_201_CREATED:
+            backfill_feed(request.user, author)
+        return response
 
     @subscribe.mapping.delete
     def delete_subscribe(self, request, pk):
         '''
         Осуществляет отписку от пользователя.
         '''
-        author = get_object_or_404(CustomUser, id=pk)
-        if not Follow.objects.filter(
-            user=request.user,
-            author=author.id
-        ).exists():
-            data = {
-                'errors': 'Такой подписки не существует.'
-            }
-            return Response(data, status=status.HTTP_400_BAD_REQUEST)
-
-        subscription = get_object_or_404(
-            Follow,
-            user=request.user,
-            author=author
+        response = delete_relation(
+            Follow.objects.filter(user=request.user, author_id=pk),
+            'Такой подписки не существует.',
+            CustomUser, pk,
         )
-        subscription.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        if response.status_code == status.HTTP_204_NO_CONTENT:
+            drop_from_feed(request.user, pk)
+        return response
 
 
 class CustomAuthToken(ObtainAuthToken):
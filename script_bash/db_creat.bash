@@ -1,6 +1,2 @@
 #! /bin/bash
-sqlite3 backend/db.sqlite3
-.mode csv
-.separator ';'
-.import data/ingredients_1.csv ingredients
-exit
+python backend/manage.py load_ingredients data/ingredients.json